@@ -1,27 +1,431 @@
 import os
+import io
+import sys
+import argparse
+import tarfile
+import zipfile
 import numpy as np
 import json
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing.image import img_to_array, load_img
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+import hashlib
+import sqlite3
+import queue
+import threading
+import time
+import uuid
+import random
+import cProfile
+import functools
+import itertools
+from contextlib import contextmanager, nullcontext
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from PIL import Image
+from flask import Flask, Response, abort, render_template, request, jsonify, redirect, send_from_directory, url_for, stream_with_context
 from werkzeug.utils import secure_filename
+try:
+    from flask_sock import ConnectionClosed, Sock
+except ImportError:
+    Sock = None
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
+app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', 'static/uploads')
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
+# Gom các request đồng thời thành một batch trước khi gọi model
+app.config['BATCH_MAX_SIZE'] = int(os.environ.get('BATCH_MAX_SIZE', 8))
+app.config['BATCH_MAX_WAIT_MS'] = float(os.environ.get('BATCH_MAX_WAIT_MS', 5))
+# Lưu ảnh upload (chỉ dùng cho thumbnail ở result.html) trong background thread.
+# Tên file theo hash nội dung; janitor xóa file cũ hơn UPLOAD_MAX_AGE giây hoặc khi
+# thư mục vượt UPLOAD_MAX_BYTES.
+app.config['SAVE_UPLOADS_ASYNC'] = os.environ.get('SAVE_UPLOADS_ASYNC', '1') == '1'
+app.config['UPLOAD_THUMBNAIL_SIZE'] = int(os.environ.get('UPLOAD_THUMBNAIL_SIZE', 512))
+app.config['UPLOAD_MAX_BYTES'] = int(os.environ.get('UPLOAD_MAX_BYTES', 256 * 1024 * 1024))
+app.config['UPLOAD_MAX_AGE'] = float(os.environ.get('UPLOAD_MAX_AGE', 24 * 3600))
+app.config['UPLOAD_JANITOR_INTERVAL'] = float(os.environ.get('UPLOAD_JANITOR_INTERVAL', 300))
+# Cache kết quả theo hash nội dung ảnh; PREDICTION_CACHE_DB dùng chung giữa các worker
+app.config['PREDICTION_CACHE_SIZE'] = int(os.environ.get('PREDICTION_CACHE_SIZE', 1024))
+app.config['PREDICTION_CACHE_TTL'] = float(os.environ.get('PREDICTION_CACHE_TTL', 3600))
+app.config['PREDICTION_CACHE_DB'] = os.environ.get('PREDICTION_CACHE_DB', '')
+# Phân tích hàng loạt: cả thư mục / file nén, trả kết quả dạng NDJSON
+app.config['ARCHIVE_EXTENSIONS'] = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+app.config['BULK_BATCH_SIZE'] = int(os.environ.get('BULK_BATCH_SIZE', 32))
+app.config['BULK_DECODE_WORKERS'] = int(os.environ.get('BULK_DECODE_WORKERS', 4))
+app.config['BULK_MAX_CONTENT_LENGTH'] = int(os.environ.get('BULK_MAX_CONTENT_LENGTH', 512 * 1024 * 1024))
+# Giới hạn cho từng ảnh trong bulk (kể cả từng file trong archive), mặc định bằng MAX_CONTENT_LENGTH
+app.config['BULK_MAX_IMAGE_BYTES'] = int(os.environ.get('BULK_MAX_IMAGE_BYTES', app.config['MAX_CONTENT_LENGTH']))
+# Backend suy luận: 'keras' (file .h5) hoặc 'tflite' (file tạo bởi export_model.py)
+app.config['INFERENCE_BACKEND'] = os.environ.get('INFERENCE_BACKEND', 'keras')
+app.config['TFLITE_MODEL_PATH'] = os.environ.get('TFLITE_MODEL_PATH', 'model/model_float16.tflite')
+app.config['TFLITE_NUM_THREADS'] = int(os.environ.get('TFLITE_NUM_THREADS', os.cpu_count() or 1))
+# Model được load trong background sau khi fork; /readyz báo sẵn sàng sau khi warm up xong.
+# MODEL_PRELOAD=1 (gunicorn --preload) đọc file model TFLite một lần trong master để các worker
+# dùng chung trang bộ nhớ của flatbuffer (copy-on-write).
+app.config['MODEL_AUTOLOAD'] = os.environ.get('MODEL_AUTOLOAD', '1') == '1'
+app.config['MODEL_PRELOAD'] = os.environ.get('MODEL_PRELOAD', '0') == '1'
+app.config['MODEL_WARMUP'] = os.environ.get('MODEL_WARMUP', '1') == '1'
+app.config['MODEL_LOAD_TIMEOUT'] = float(os.environ.get('MODEL_LOAD_TIMEOUT', 300))
+# Đo thời gian từng bước xử lý, xuất ở /metrics (định dạng text của Prometheus).
+# PROFILE_SAMPLE_RATE > 0: chạy cProfile cho một phần request, ghi file .prof vào PROFILE_DIR
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+# Phân tích luồng camera liên tục (WebSocket /ws/stream, MJPEG /analyze_esp32):
+# bỏ qua frame gần giống frame đã phân tích, làm mượt kết quả qua cửa sổ trượt
+app.config['STREAM_DIFF_THRESHOLD'] = float(os.environ.get('STREAM_DIFF_THRESHOLD', 0.02))
+app.config['STREAM_SMOOTHING_WINDOW'] = int(os.environ.get('STREAM_SMOOTHING_WINDOW', 5))
+app.config['STREAM_MAX_FRAME_BYTES'] = int(os.environ.get('STREAM_MAX_FRAME_BYTES', 4 * 1024 * 1024))
+# Chế độ top-k / test-time augmentation (lật, cắt ảnh), bật theo request bằng tham số
+# top_k và tta (số view hoặc 'on'); giá trị mặc định áp dụng khi request không truyền.
+# TTA_MAX_VIEWS giới hạn chi phí mỗi request (mọi view chạy trong một lần gọi model khi
+# TTA_MAX_VIEWS <= BATCH_MAX_SIZE).
+app.config['PREDICT_TOP_K'] = int(os.environ.get('PREDICT_TOP_K', 1))
+app.config['PREDICT_TTA_VIEWS'] = int(os.environ.get('PREDICT_TTA_VIEWS', 1))
+app.config['TOP_K_MAX'] = int(os.environ.get('TOP_K_MAX', 5))
+app.config['TTA_DEFAULT_VIEWS'] = int(os.environ.get('TTA_DEFAULT_VIEWS', 4))
+app.config['TTA_MAX_VIEWS'] = int(os.environ.get('TTA_MAX_VIEWS', 8))
+
+IMAGE_SIZE = (224, 224)
 
 # Tạo thư mục uploads nếu chưa tồn tại
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Load model
-MODEL_PATH = 'model/model_epoch_15 (1).h5'
-model = load_model(MODEL_PATH)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+class Metrics:
+    # Counter / gauge / histogram tối giản, số liệu riêng cho từng worker.
+    # Khi tắt, mọi hàm trả về ngay để không ảnh hưởng hot path.
+    TYPES = {
+        'request_duration_seconds': ('histogram', 'Thời gian xử lý request theo endpoint', LATENCY_BUCKETS),
+        'stage_duration_seconds': ('histogram', 'Thời gian từng bước: upload_read, upload_save, preprocess, inference, model_predict, render', LATENCY_BUCKETS),
+        'model_batch_size': ('histogram', 'Số ảnh trong mỗi lần gọi model', BATCH_SIZE_BUCKETS),
+        'requests_in_flight': ('gauge', 'Số request đang xử lý theo endpoint', None),
+        'requests_total': ('counter', 'Số request theo endpoint và mã trạng thái', None),
+        'model_calls_total': ('counter', 'Số lần gọi model', None),
+        'model_images_total': ('counter', 'Số ảnh đã đưa qua model', None),
+        'predictions_total': ('counter', 'Phân bố lớp được model dự đoán', None),
+        'stream_frames_total': ('counter', 'Số frame nhận qua stream theo kết quả: analyzed, similar, dropped', None),
+    }
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._values = defaultdict(float)
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] += value
+
+    def dec(self, name, value=1, **labels):
+        self.inc(name, -value, **labels)
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        buckets = self.TYPES[name][2]
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def time(self, name, **labels):
+        if not self.enabled:
+            return nullcontext()
+        return self._timer(name, labels)
+
+    @contextmanager
+    def _timer(self, name, labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ''
+        return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in items)
+
+    def render(self, gauges=()):
+        # gauges: các giá trị tính tại thời điểm scrape, dạng (name, help, value)
+        lines = []
+        with self._lock:
+            values = sorted(self._values.items())
+            histograms = sorted((k, (list(h[0]), h[1], h[2])) for k, h in self._histograms.items())
+        for name, (kind, help_text, buckets) in self.TYPES.items():
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            if kind == 'histogram':
+                for (metric, labels), (counts, total, count) in histograms:
+                    if metric != name:
+                        continue
+                    for bound, bucket_count in zip(buckets, counts):
+                        lines.append('%s_bucket%s %d' % (name, self._labels(labels, [('le', bound)]), bucket_count))
+                    lines.append('%s_bucket%s %d' % (name, self._labels(labels, [('le', '+Inf')]), count))
+                    lines.append('%s_sum%s %r' % (name, self._labels(labels), total))
+                    lines.append('%s_count%s %d' % (name, self._labels(labels), count))
+            else:
+                for (metric, labels), value in values:
+                    if metric == name:
+                        lines.append('%s%s %r' % (name, self._labels(labels), value))
+        for name, help_text, value in gauges:
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s gauge' % name)
+            lines.append('%s %r' % (name, float(value)))
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics(enabled=app.config['METRICS_ENABLED'])
+
+_profile_lock = threading.Lock()
+
+def instrumented(endpoint):
+    # Đo thời gian, số request đang xử lý, và (nếu bật) profile ngẫu nhiên một phần request
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled and not app.config['PROFILE_SAMPLE_RATE']:
+                return view(*args, **kwargs)
+            metrics.inc('requests_in_flight', endpoint=endpoint)
+            start = time.perf_counter()
+
+            def finish(status):
+                metrics.dec('requests_in_flight', endpoint=endpoint)
+                metrics.observe('request_duration_seconds', time.perf_counter() - start, endpoint=endpoint)
+                metrics.inc('requests_total', endpoint=endpoint, status=status)
+
+            try:
+                # Chuyển giá trị trả về thành Response để ghi nhận đúng mã trạng thái Flask gửi đi
+                # (view trả về None cũng thành 500 như khi Flask tự xử lý)
+                response = app.make_response(_profiled(endpoint, view, *args, **kwargs))
+            except Exception:
+                finish(500)
+                raise
+            status = response.status_code
+            if response.is_streamed:
+                # Response dạng stream (NDJSON): chỉ ghi nhận khi stream kết thúc
+                response.call_on_close(lambda: finish(status))
+            else:
+                finish(status)
+            return response
+        return wrapper
+    return decorator
+
+def _profiled(endpoint, view, *args, **kwargs):
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    # Chỉ một profiler chạy tại một thời điểm (cProfile không hỗ trợ profile lồng nhau)
+    if not rate or random.random() >= rate or not _profile_lock.acquire(blocking=False):
+        return view(*args, **kwargs)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            profiler.disable()
+            os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+            profiler.dump_stats(os.path.join(app.config['PROFILE_DIR'], '%s-%d-%d.prof' % (
+                endpoint, os.getpid(), int(time.time() * 1000))))
+    finally:
+        _profile_lock.release()
+
+def load_tflite_interpreter(model_path, num_threads=None, model_content=None):
+    # Ưu tiên tflite-runtime / ai-edge-litert để không phải import toàn bộ TensorFlow
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            # tensorflow.lite là module API tải lười: Interpreter chỉ lấy được qua thuộc tính
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    if model_content is not None:
+        return Interpreter(model_content=model_content, num_threads=num_threads)
+    return Interpreter(model_path=model_path, num_threads=num_threads)
+
+class TFLiteModel:
+    # Bọc TFLite interpreter với cùng API predict(batch) như Keras model.
+    # Chỉ dùng một interpreter với kích thước batch cố định (BATCH_MAX_SIZE): mỗi interpreter
+    # có tensor arena, bản trọng số đóng gói cho XNNPACK và thread pool riêng, nên batch nhỏ
+    # hơn được pad thêm ảnh 0 và batch lớn hơn chạy thành nhiều lần thay vì tạo interpreter mới.
+    def __init__(self, model_path, num_threads=None, batch_size=1, model_content=None):
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.batch_size = max(1, int(batch_size))
+        self._lock = threading.Lock()
+        self._interpreter = load_tflite_interpreter(model_path, num_threads, model_content)
+        self._input = self._interpreter.get_input_details()[0]
+        self._interpreter.resize_tensor_input(self._input['index'], [self.batch_size] + list(IMAGE_SIZE) + [3])
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._padded = np.zeros((self.batch_size,) + IMAGE_SIZE + (3,), dtype=np.float32)
 
-# Load class mapping
-with open('model/class_indices_moi.json', 'r') as f:
-    class_indices = json.load(f)
+    def predict(self, batch, **kwargs):
+        batch = np.asarray(batch, dtype=np.float32)
+        outputs = [self._invoke(batch[i:i + self.batch_size]) for i in range(0, len(batch), self.batch_size)]
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs)
+
+    def _invoke(self, chunk):
+        n = len(chunk)
+        with self._lock:
+            if n < self.batch_size:
+                self._padded[:n] = chunk
+                self._padded[n:] = 0
+                chunk = self._padded
+            # Model int8 đầy đủ: lượng tử hóa input và giải lượng tử output
+            scale, zero_point = self._input['quantization']
+            if self._input['dtype'] != np.float32 and scale:
+                chunk = np.round(chunk / scale + zero_point).astype(self._input['dtype'])
+            self._interpreter.set_tensor(self._input['index'], chunk)
+            self._interpreter.invoke()
+            output = self._interpreter.get_tensor(self._output['index'])[:n].copy()
+        scale, zero_point = self._output['quantization']
+        if self._output['dtype'] != np.float32 and scale:
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+class ModelRegistry:
+    # Giữ model và class mapping; load trong background thread để worker
+    # phục vụ được trang tĩnh ngay, request dự đoán sẽ chờ đến khi model sẵn sàng.
+    def __init__(self, backend, model_path, class_indices_path, warmup=True):
+        if backend not in ('keras', 'tflite'):
+            raise ValueError('Unknown INFERENCE_BACKEND: %s' % backend)
+        self.backend = backend
+        self.model_path = model_path
+        self.class_indices_path = class_indices_path
+        self.warmup_enabled = warmup
+        self.model = None
+        self.model_content = None
+        self.class_indices = None
+        self.state = 'idle'
+        self.error = None
+        self.load_seconds = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def load_class_indices(self):
+        if self.class_indices is None:
+            with open(self.class_indices_path, 'r') as f:
+                self.class_indices = json.load(f)
+        return self.class_indices
+
+    def preload(self):
+        # Chạy trong gunicorn master trước khi fork: chỉ đọc flatbuffer TFLite để các worker
+        # dùng chung trang bộ nhớ (copy-on-write). Interpreter được tạo trong từng worker vì
+        # allocate_tensors khởi động thread pool của XNNPACK, và thread không tồn tại qua fork.
+        try:
+            with open(self.model_path, 'rb') as f:
+                self.model_content = f.read()
+        except OSError:
+            # Worker sẽ thử load lại và báo lỗi qua /readyz
+            app.logger.exception('Model preload failed')
+
+    def load(self):
+        if self.model is None:
+            start = time.perf_counter()
+            if self.backend == 'tflite':
+                self.model = TFLiteModel(self.model_path, app.config['TFLITE_NUM_THREADS'],
+                                         batch_size=app.config['BATCH_MAX_SIZE'],
+                                         model_content=self.model_content)
+            else:
+                from tensorflow.keras.models import load_model
+                self.model = load_model(self.model_path)
+            self.load_seconds = time.perf_counter() - start
+        self.load_class_indices()
+        return self.model
+
+    def warmup(self):
+        # Chạy một batch giả để khởi tạo graph / thread pool trước khi nhận traffic
+        self.model.predict(np.zeros((1,) + IMAGE_SIZE + (3,), dtype=np.float32), verbose=0)
+
+    def _run(self):
+        try:
+            self.load()
+            if self.warmup_enabled:
+                self.warmup()
+            self.state = 'ready'
+        except Exception as e:
+            app.logger.exception('Model loading failed')
+            self.error = str(e)
+            self.state = 'failed'
+        finally:
+            self._ready.set()
+
+    def start(self):
+        # Thread không tồn tại qua fork nên mỗi process (worker) tự khởi động lại
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._ready = threading.Event()
+            self.state = 'loading'
+            self.error = None
+            threading.Thread(target=self._run, name='model-loader', daemon=True).start()
+
+    def get(self, timeout=None):
+        self.start()
+        if timeout is None:
+            timeout = app.config['MODEL_LOAD_TIMEOUT']
+        if not self._ready.wait(timeout):
+            raise RuntimeError('Model is still loading')
+        if self.state != 'ready':
+            raise RuntimeError('Model failed to load: %s' % self.error)
+        return self.model
+
+    def is_ready(self):
+        return self.state == 'ready' and self._pid == os.getpid()
+
+    def status(self):
+        return {
+            "state": self.state if self._pid == os.getpid() else 'idle',
+            "backend": self.backend,
+            "model_path": self.model_path,
+            "preloaded": self.model_content is not None,
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+        }
+
+MODEL_PATH = os.environ.get('MODEL_PATH', 'model/model_epoch_15 (1).h5')
+ACTIVE_MODEL_PATH = app.config['TFLITE_MODEL_PATH'] if app.config['INFERENCE_BACKEND'] == 'tflite' else MODEL_PATH
+
+def model_version(model_path):
+    # Không stat được file (chưa có model) thì dùng tên file; ModelRegistry sẽ báo lỗi
+    # qua /readyz thay vì làm worker không khởi động được.
+    if os.environ.get('MODEL_VERSION'):
+        return os.environ['MODEL_VERSION']
+    try:
+        return '%s:%d' % (os.path.basename(model_path), int(os.path.getmtime(model_path)))
+    except OSError:
+        return os.path.basename(model_path)
+
+MODEL_VERSION = model_version(ACTIVE_MODEL_PATH)
+
+model_registry = ModelRegistry(app.config['INFERENCE_BACKEND'], ACTIVE_MODEL_PATH,
+                               'model/class_indices_moi.json', warmup=app.config['MODEL_WARMUP'])
+if app.config['MODEL_PRELOAD']:
+    if app.config['INFERENCE_BACKEND'] == 'tflite':
+        # Interpreter được tạo và warm up trong từng worker (post_fork trong gunicorn.conf.py)
+        model_registry.preload()
+    else:
+        # Fork sau khi TensorFlow đã tạo thread pool có thể làm worker bị treo
+        app.logger.warning('MODEL_PRELOAD only shares weights with INFERENCE_BACKEND=tflite, '
+                           'the Keras model is loaded in each worker instead')
+elif app.config['MODEL_AUTOLOAD']:
+    model_registry.start()
 
 # Tạo dictionary phân loại và thông tin bệnh
 # Dictionary đầy đủ thông tin về tất cả các loại bệnh
@@ -203,45 +607,855 @@ disease_info = {
     }
 }
 
+class BatchPredictor:
+    # Gom các ảnh đến cùng lúc từ nhiều thread thành một tensor (N, 224, 224, 3)
+    # và gọi model một lần; mỗi caller nhận lại đúng dòng kết quả của mình.
+    # Hàng đợi ưu tiên: request tương tác luôn được lấy trước các phần của bulk,
+    # nên một file nén lớn chỉ làm request webcam chờ tối đa một batch.
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_BULK = 1
+
+    def __init__(self, predict_fn, max_batch_size=8, max_wait_ms=5):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batch_size_histogram = Counter()
+        self.queue_depth_histogram = Counter()
+        self.batches = 0
+        self.images = 0
+
+    def _ensure_started(self):
+        # Thread được tạo lúc dùng lần đầu để an toàn khi gunicorn fork worker
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='batch-predictor', daemon=True)
+                self._thread.start()
+
+    def submit_many(self, image_arrays, priority=PRIORITY_INTERACTIVE):
+        # Nhóm ảnh (k, 224, 224, 3) được chia thành các phần tối đa max_batch_size ảnh,
+        # mỗi phần chạy trong một lần gọi model; trả về một Future cho mỗi phần
+        self._ensure_started()
+        image_arrays = np.asarray(image_arrays)
+        futures = []
+        for start in range(0, len(image_arrays), self.max_batch_size):
+            future = Future()
+            self._queue.put((priority, next(self._sequence), image_arrays[start:start + self.max_batch_size], future))
+            futures.append(future)
+        return futures
+
+    def predict(self, image_array):
+        return self.submit_many(image_array[np.newaxis])[0].result()[0]
+
+    def predict_many(self, image_arrays, priority=PRIORITY_INTERACTIVE):
+        results = [future.result() for future in self.submit_many(image_arrays, priority)]
+        return results[0] if len(results) == 1 else np.concatenate(results)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0][2])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if size + len(item[2]) > self.max_batch_size:
+                # Phần không vừa batch hiện tại trả lại hàng đợi, giữ nguyên thứ tự
+                self._queue.put(item)
+                break
+            batch.append(item)
+            size += len(item[2])
+        return batch, size
+
+    def _run(self):
+        while True:
+            batch, size = self._collect()
+            with self._lock:
+                self.queue_depth_histogram[self._queue.qsize() + len(batch)] += 1
+                self.batch_size_histogram[size] += 1
+                self.batches += 1
+                self.images += size
+
+            futures = [item[3] for item in batch]
+            try:
+                images = batch[0][2] if len(batch) == 1 else np.concatenate([item[2] for item in batch])
+                with metrics.time('stage_duration_seconds', stage='model_predict'):
+                    predictions = self.predict_fn(images)
+                record_model_call(size)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for _, _, images, future in batch:
+                future.set_result(predictions[offset:offset + len(images)])
+                offset += len(images)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": self._queue.qsize(),
+                "batches": self.batches,
+                "images": self.images,
+                "batch_size_histogram": dict(sorted(self.batch_size_histogram.items())),
+                "queue_depth_histogram": dict(sorted(self.queue_depth_histogram.items())),
+            }
+
+def record_model_call(batch_size):
+    metrics.inc('model_calls_total')
+    metrics.inc('model_images_total', batch_size)
+    metrics.observe('model_batch_size', batch_size)
+
+def _model_predict(batch):
+    return model_registry.get().predict(batch, batch_size=len(batch), verbose=0)
+
+batch_predictor = BatchPredictor(_model_predict,
+                                 max_batch_size=app.config['BATCH_MAX_SIZE'],
+                                 max_wait_ms=app.config['BATCH_MAX_WAIT_MS'])
+
+class SQLiteCacheBackend:
+    # Cache trên đĩa dùng chung cho nhiều gunicorn worker. Kết nối được mở ở lần dùng đầu
+    # trong từng thread (không mở trong gunicorn master trước khi fork).
+    # Cột accessed chỉ được cập nhật khi cũ hơn TOUCH_INTERVAL giây, nên phần lớn cache hit
+    # chỉ là một lệnh đọc, không phải một transaction ghi mà mọi worker phải xếp hàng chờ.
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS predictions ('
+                             'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                             'created REAL NOT NULL, accessed REAL NOT NULL)')
+                conn.execute('CREATE INDEX IF NOT EXISTS predictions_accessed ON predictions (accessed)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        # Trả về (value, created) với created là time.time() lúc ghi
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute('SELECT value, created, accessed FROM predictions WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, created, accessed = row
+        if self.ttl and now - created > self.ttl:
+            with conn:
+                conn.execute('DELETE FROM predictions WHERE key = ?', (key,))
+            return None
+        if now - accessed > self.TOUCH_INTERVAL:
+            with conn:
+                conn.execute('UPDATE predictions SET accessed = ? WHERE key = ?', (now, key))
+        return json.loads(value), created
+
+    def put(self, key, value):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)',
+                         (key, json.dumps(value), now, now))
+            excess = conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute('DELETE FROM predictions WHERE key IN '
+                             '(SELECT key FROM predictions ORDER BY accessed LIMIT ?)', (excess,))
+
+def content_digest(data):
+    # Hash nội dung ảnh, tính một lần cho mỗi request và dùng cho cả cache lẫn tên file upload
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+class PredictionCache:
+    # LRU + TTL trong bộ nhớ, có thể kèm backend SQLite phía sau
+    def __init__(self, max_entries=1024, ttl=3600, model_version='', backend=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.model_version = model_version
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, data, *options):
+        return self.key_for_digest(content_digest(data), *options)
+
+    def key_for_digest(self, digest, *options):
+        h = hashlib.blake2b(digest.encode('ascii'), digest_size=16)
+        h.update(self.model_version.encode('utf-8'))
+        if options:
+            h.update(repr(options).encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, key):
+        if self.max_entries <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created = entry
+                if self.ttl and now - created > self.ttl:
+                    del self._entries[key]
+                    self.evictions += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(value)
+        entry = self.backend.get(key) if self.backend is not None else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            value, created = entry
+            self.hits += 1
+            # Giữ tuổi của entry trong backend để nó không sống thêm một TTL trong bộ nhớ
+            self._store(key, value, now - max(0.0, time.time() - created))
+        return dict(value)
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        value = dict(value)
+        with self._lock:
+            self._store(key, value, time.monotonic())
+        if self.backend is not None:
+            self.backend.put(key, value)
+
+    def _store(self, key, value, now):
+        self._entries[key] = (value, now)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "model_version": self.model_version,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "shared_backend": self.backend.path if self.backend is not None else None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+prediction_cache = PredictionCache(
+    max_entries=app.config['PREDICTION_CACHE_SIZE'],
+    ttl=app.config['PREDICTION_CACHE_TTL'],
+    model_version=MODEL_VERSION,
+    backend=SQLiteCacheBackend(app.config['PREDICTION_CACHE_DB'],
+                               app.config['PREDICTION_CACHE_SIZE'],
+                               app.config['PREDICTION_CACHE_TTL'])
+    if app.config['PREDICTION_CACHE_DB'] and app.config['PREDICTION_CACHE_SIZE'] > 0 else None)
+
+class UploadStore:
+    # Lưu thumbnail ảnh upload với tên theo hash nội dung, nên các request đồng thời
+    # không ghi đè file của nhau; ghi vào file tạm rồi os.replace để không ai đọc file dở.
+    def __init__(self, folder, thumbnail_size=512, max_bytes=256 * 1024 * 1024, max_age=24 * 3600,
+                 janitor_interval=300, write_async=True):
+        self.folder = folder
+        self.thumbnail_size = thumbnail_size
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.janitor_interval = janitor_interval
+        self.write_async = write_async
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='upload-writer')
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._janitor_pid = None
+        self.evicted = 0
+
+    def name_for(self, data):
+        return content_digest(data) + '.jpg'
+
+    def save(self, data, digest=None):
+        # Lỗi ghi thumbnail chỉ được ghi log: trang kết quả vẫn hiển thị, chỉ thiếu ảnh
+        self._ensure_janitor()
+        name = (digest or content_digest(data)) + '.jpg'
+        path = os.path.join(self.folder, name)
+        with self._lock:
+            if name in self._pending:
+                return name
+            try:
+                # Cập nhật mtime để janitor coi như file vừa được dùng
+                os.utime(path)
+                return name
+            except FileNotFoundError:
+                # Chưa có file, hoặc janitor vừa xóa: ghi lại
+                pass
+            if self.write_async:
+                future = self._executor.submit(self._write_thumbnail, data, path)
+                self._pending[name] = future
+        if not self.write_async:
+            # Ghi ngoài lock để không chặn các upload khác, wait() và evict()
+            try:
+                self._write_thumbnail(data, path)
+            except Exception:
+                app.logger.exception('Saving upload thumbnail %s failed', name)
+            return name
+        future.add_done_callback(lambda f: self._done(name, f))
+        return name
+
+    def _done(self, name, future):
+        with self._lock:
+            self._pending.pop(name, None)
+        error = future.exception()
+        if error is not None:
+            app.logger.error('Saving upload thumbnail %s failed', name, exc_info=error)
+
+    def _write_thumbnail(self, data, path):
+        img = Image.open(io.BytesIO(data))
+        size = (self.thumbnail_size, self.thumbnail_size)
+        if img.format == 'JPEG':
+            img.draft('RGB', size)
+        img = img.convert('RGB')
+        img.thumbnail(size)
+        tmp_path = os.path.join(self.folder, '.tmp-%s' % uuid.uuid4().hex)
+        try:
+            img.save(tmp_path, format='JPEG', quality=85)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def wait(self, name, timeout=5):
+        # Trang kết quả có thể yêu cầu ảnh trước khi thread ghi xong
+        with self._lock:
+            future = self._pending.get(name)
+        if future is not None:
+            try:
+                future.result(timeout)
+            except Exception:
+                pass
+
+    def evict(self):
+        now = time.time()
+        entries = []
+        with self._lock:
+            pending = set(self._pending)
+        for entry in os.scandir(self.folder):
+            if not entry.is_file() or entry.name in pending or entry.name.startswith('.git'):
+                continue
+            stat = entry.stat()
+            # File tạm bị bỏ lại (ví dụ worker bị kill giữa chừng)
+            if entry.name.startswith('.tmp-') and now - stat.st_mtime < 3600:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            if (self.max_age and now - mtime > self.max_age) or (self.max_bytes and total > self.max_bytes) \
+                    or os.path.basename(path).startswith('.tmp-'):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+        self.evicted += removed
+        return removed
+
+    def _janitor(self):
+        while True:
+            try:
+                self.evict()
+            except Exception:
+                app.logger.exception('Upload janitor failed')
+            time.sleep(self.janitor_interval)
+
+    def _ensure_janitor(self):
+        # Mỗi worker có janitor riêng; thread không tồn tại qua fork
+        with self._lock:
+            if self._janitor_pid == os.getpid():
+                return
+            self._janitor_pid = os.getpid()
+        threading.Thread(target=self._janitor, name='upload-janitor', daemon=True).start()
+
+upload_store = UploadStore(app.config['UPLOAD_FOLDER'],
+                           thumbnail_size=app.config['UPLOAD_THUMBNAIL_SIZE'],
+                           max_bytes=app.config['UPLOAD_MAX_BYTES'],
+                           max_age=app.config['UPLOAD_MAX_AGE'],
+                           janitor_interval=app.config['UPLOAD_JANITOR_INTERVAL'],
+                           write_async=app.config['SAVE_UPLOADS_ASYNC'])
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
 def preprocess_image(image_path):
-    img = load_img(image_path, target_size=(224, 224))
+    from tensorflow.keras.preprocessing.image import img_to_array, load_img
+    img = load_img(image_path, target_size=IMAGE_SIZE)
     img_array = img_to_array(img)
     img_array = img_array / 255.0
     img_array = np.expand_dims(img_array, axis=0)
     return img_array
 
+# Mỗi thread có một buffer float32 (224, 224, 3) dùng lại giữa các request.
+# An toàn vì predict_disease_array chặn cho đến khi batch chứa buffer này chạy xong.
+_preprocess_buffers = threading.local()
+
+def _preprocess_buffer():
+    buf = getattr(_preprocess_buffers, 'array', None)
+    if buf is None:
+        buf = np.empty(IMAGE_SIZE + (3,), dtype=np.float32)
+        _preprocess_buffers.array = buf
+    return buf
+
+def preprocess_image_stream(stream, out=None):
+    # Decode trực tiếp từ buffer của request, không ghi ra đĩa
+    img = Image.open(stream)
+    if img.format == 'JPEG':
+        # JPEG: giải mã ở tỉ lệ 1/2, 1/4, 1/8 (DCT scaling) khi ảnh lớn
+        img.draft('RGB', IMAGE_SIZE)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if img.size != IMAGE_SIZE:
+        # Giống load_img(target_size=...) mặc định dùng nearest
+        img = img.resize(IMAGE_SIZE, Image.NEAREST)
+    if out is None:
+        out = _preprocess_buffer()
+    np.divide(np.asarray(img, dtype=np.uint8), 255.0, out=out)
+    return out
+
 def predict_disease(image_path):
-    processed_image = preprocess_image(image_path)
-    prediction = model.predict(processed_image)
-    predicted_class_index = np.argmax(prediction[0])
-    predicted_class_name = class_indices[str(predicted_class_index)]
-    confidence = float(prediction[0][predicted_class_index])
-    
-    # Lấy thông tin bệnh từ dictionary
-    if predicted_class_name in disease_info:
-        info = disease_info[predicted_class_name]
+    return predict_disease_array(preprocess_image(image_path)[0])
+
+def predict_disease_stream(stream):
+    with metrics.time('stage_duration_seconds', stage='preprocess'):
+        img_array = preprocess_image_stream(stream)
+    return predict_disease_array(img_array)
+
+def predict_disease_bytes(data, top_k=1, tta_views=1, digest=None):
+    # Ảnh giống hệt byte-by-byte trả về từ cache, không decode và không gọi model
+    digest = digest or content_digest(data)
+    if top_k <= 1 and tta_views <= 1:
+        key = prediction_cache.key_for_digest(digest)
     else:
-        # Nếu không tìm thấy thông tin, tạo thông tin cơ bản
-        info = {
-            "name": predicted_class_name.replace('___', ' - ').replace('_', ' '),
-            "description": "Đây là loại bệnh hoặc tình trạng lá cây được nhận diện bởi hệ thống.",
-            "treatment": "Vui lòng tham khảo ý kiến chuyên gia nông nghiệp để có hướng dẫn điều trị cụ thể."
-        }
-    
+        key = prediction_cache.key_for_digest(digest, top_k, tta_views)
+    result = prediction_cache.get(key)
+    if result is None:
+        if top_k <= 1 and tta_views <= 1:
+            result = predict_disease_stream(io.BytesIO(data))
+        else:
+            with metrics.time('stage_duration_seconds', stage='preprocess'):
+                img_array = preprocess_image_stream(io.BytesIO(data))
+            result = predict_disease_tta(img_array, top_k=top_k, tta_views=tta_views)
+        prediction_cache.put(key, result)
+    else:
+        metrics.inc('predictions_total', class_name=result["class_name"])
+    return result
+
+def predict_disease_array(img_array):
+    return build_result(predict_probabilities(img_array))
+
+def predict_probabilities(img_array):
+    # Gồm cả thời gian chờ trong hàng đợi batch
+    with metrics.time('stage_duration_seconds', stage='inference'):
+        return batch_predictor.predict(img_array)
+
+# Các phép biến đổi cho TTA theo thứ tự ưu tiên; tta_views = n dùng n phép đầu tiên
+TTA_TRANSFORMS = ('identity', 'flip_h', 'flip_v', 'crop_center', 'crop_tl', 'crop_tr', 'crop_bl', 'crop_br')
+TTA_CROP_FRACTION = 0.875
+
+def _crop_indices(size, fraction, position):
+    crop = int(round(size * fraction))
+    start = {'start': 0, 'center': (size - crop) // 2, 'end': size - crop}[position]
+    # Lấy mẫu nearest để phóng phần cắt về lại kích thước gốc
+    return np.linspace(start, start + crop - 1, size).round().astype(np.intp)
+
+def make_tta_views(img_array, n_views):
+    n_views = max(1, min(n_views, len(TTA_TRANSFORMS)))
+    views = np.empty((n_views,) + img_array.shape, dtype=np.float32)
+    height, width = img_array.shape[:2]
+    crop_positions = {
+        'crop_center': ('center', 'center'),
+        'crop_tl': ('start', 'start'),
+        'crop_tr': ('start', 'end'),
+        'crop_bl': ('end', 'start'),
+        'crop_br': ('end', 'end'),
+    }
+    for i, transform in enumerate(TTA_TRANSFORMS[:n_views]):
+        if transform == 'identity':
+            views[i] = img_array
+        elif transform == 'flip_h':
+            views[i] = img_array[:, ::-1]
+        elif transform == 'flip_v':
+            views[i] = img_array[::-1]
+        else:
+            row_pos, col_pos = crop_positions[transform]
+            rows = _crop_indices(height, TTA_CROP_FRACTION, row_pos)
+            cols = _crop_indices(width, TTA_CROP_FRACTION, col_pos)
+            views[i] = img_array[np.ix_(rows, cols)]
+    return views
+
+def predict_disease_tta(img_array, top_k=1, tta_views=1):
+    # Mọi view của một ảnh đi qua model trong đúng một lần gọi, rồi lấy trung bình xác suất
+    if tta_views > 1:
+        views = make_tta_views(img_array, tta_views)
+        with metrics.time('stage_duration_seconds', stage='inference'):
+            prediction = np.mean(batch_predictor.predict_many(views), axis=0)
+    else:
+        views = None
+        prediction = predict_probabilities(img_array)
+    result = build_result(prediction, top_k=top_k)
+    result["tta_views"] = 1 if views is None else len(views)
+    return result
+
+def disease_details(class_name):
+    # Lấy thông tin bệnh từ dictionary
+    if class_name in disease_info:
+        return disease_info[class_name]
+    # Nếu không tìm thấy thông tin, tạo thông tin cơ bản
     return {
+        "name": class_name.replace('___', ' - ').replace('_', ' '),
+        "description": "Đây là loại bệnh hoặc tình trạng lá cây được nhận diện bởi hệ thống.",
+        "treatment": "Vui lòng tham khảo ý kiến chuyên gia nông nghiệp để có hướng dẫn điều trị cụ thể."
+    }
+
+def build_result(prediction, top_k=1):
+    predicted_class_index = np.argmax(prediction)
+    predicted_class_name = model_registry.class_indices[str(predicted_class_index)]
+    confidence = float(prediction[predicted_class_index])
+    metrics.inc('predictions_total', class_name=predicted_class_name)
+    
+    info = disease_details(predicted_class_name)
+    result = {
         "class_name": predicted_class_name,
         "disease_name": info["name"],
         "description": info["description"],
         "treatment": info["treatment"],
         "confidence": confidence
     }
+    if top_k > 1:
+        top_indices = np.argsort(prediction)[::-1][:top_k]
+        result["top_k"] = []
+        for index in top_indices:
+            class_name = model_registry.class_indices[str(index)]
+            info = disease_details(class_name)
+            result["top_k"].append({
+                "class_name": class_name,
+                "disease_name": info["name"],
+                "description": info["description"],
+                "treatment": info["treatment"],
+                "confidence": float(prediction[index])
+            })
+    return result
+
+def prediction_options(values):
+    # Đọc top_k / tta từ form hoặc query string, giới hạn theo cấu hình
+    try:
+        top_k = int(values.get('top_k', app.config['PREDICT_TOP_K']))
+    except ValueError:
+        top_k = app.config['PREDICT_TOP_K']
+    tta = str(values.get('tta', app.config['PREDICT_TTA_VIEWS'])).lower()
+    if tta in ('on', 'true', 'yes'):
+        views = app.config['TTA_DEFAULT_VIEWS']
+    elif tta in ('off', 'false', 'no', ''):
+        views = 1
+    else:
+        try:
+            views = int(tta)
+        except ValueError:
+            views = 1
+    top_k = max(1, min(top_k, app.config['TOP_K_MAX']))
+    views = max(1, min(views, app.config['TTA_MAX_VIEWS'], len(TTA_TRANSFORMS)))
+    return top_k, views
+
+def is_archive(filename):
+    return filename.lower().endswith(app.config['ARCHIVE_EXTENSIONS'])
+
+class ImageTooLarge(ValueError):
+    pass
+
+def _read_limited(f, size, max_bytes):
+    # Kiểm tra kích thước khai báo trước khi đọc, và chỉ đọc tối đa max_bytes + 1 byte
+    # phòng khi kích thước khai báo trong archive không đúng
+    if size > max_bytes:
+        return ImageTooLarge('Image is larger than %d bytes' % max_bytes)
+    data = f.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        return ImageTooLarge('Image is larger than %d bytes' % max_bytes)
+    return data
+
+# Các hàm iter_* trả về (tên, bytes) hoặc (tên, ImageTooLarge) cho ảnh vượt giới hạn
+def iter_archive(fileobj, filename, max_bytes=None):
+    # Đọc lần lượt từng ảnh trong file nén, không giải nén toàn bộ ra đĩa
+    max_bytes = max_bytes or app.config['BULK_MAX_IMAGE_BYTES']
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(fileobj) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and allowed_file(info.filename):
+                    with zf.open(info) as f:
+                        yield info.filename, _read_limited(f, info.file_size, max_bytes)
+    else:
+        with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+            for member in tar:
+                if member.isfile() and allowed_file(member.name):
+                    yield member.name, _read_limited(tar.extractfile(member), member.size, max_bytes)
+
+def iter_path(path, max_bytes=None):
+    max_bytes = max_bytes or app.config['BULK_MAX_IMAGE_BYTES']
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if allowed_file(name):
+                    file_path = os.path.join(root, name)
+                    with open(file_path, 'rb') as f:
+                        yield file_path, _read_limited(f, os.fstat(f.fileno()).st_size, max_bytes)
+    elif is_archive(path):
+        with open(path, 'rb') as f:
+            yield from iter_archive(f, path, max_bytes)
+    elif allowed_file(path):
+        with open(path, 'rb') as f:
+            yield path, _read_limited(f, os.fstat(f.fileno()).st_size, max_bytes)
+
+def _decode_for_bulk(data):
+    # Mỗi ảnh cần buffer riêng vì nhiều ảnh đang chờ trong cùng một batch
+    return preprocess_image_stream(io.BytesIO(data), out=np.empty(IMAGE_SIZE + (3,), dtype=np.float32))
+
+def _bulk_row(name, result):
+    return {
+        "file": name,
+        "class_name": result["class_name"],
+        "disease_name": result["disease_name"],
+        "confidence": result["confidence"],
+    }
+
+def _flush_bulk(pending, batch_size):
+    items = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+    arrays, to_predict, rows = [], [], {}
+    for i, (name, key, cached, future) in enumerate(items):
+        if cached is not None:
+            metrics.inc('predictions_total', class_name=cached["class_name"])
+            rows[i] = _bulk_row(name, cached)
+            continue
+        try:
+            arrays.append(future.result())
+            to_predict.append(i)
+        except Exception as e:
+            rows[i] = {"file": name, "error": str(e)}
+
+    if arrays:
+        try:
+            predictions = batch_predictor.predict_many(np.stack(arrays), priority=BatchPredictor.PRIORITY_BULK)
+        except Exception as e:
+            # Response đã bắt đầu stream nên không trả 500 được; báo lỗi trên từng dòng
+            app.logger.exception('Bulk prediction failed')
+            for i in to_predict:
+                rows[i] = {"file": items[i][0], "error": str(e)}
+            to_predict, predictions = [], []
+        for i, prediction in zip(to_predict, predictions):
+            name, key = items[i][0], items[i][1]
+            result = build_result(prediction)
+            prediction_cache.put(key, result)
+            rows[i] = _bulk_row(name, result)
+
+    for i in range(len(items)):
+        yield rows[i]
+
+def bulk_predict(sources, batch_size=None, workers=None):
+    # Ảnh được decode song song trong pool, model chạy theo batch lớn;
+    # chỉ giữ tối đa 2 batch trong bộ nhớ nên dùng được với archive bất kỳ kích thước
+    batch_size = batch_size or app.config['BULK_BATCH_SIZE']
+    workers = workers or app.config['BULK_DECODE_WORKERS']
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bulk-decode') as pool:
+        for name, data in sources:
+            if isinstance(data, Exception):
+                # Ảnh không đọc được (ví dụ vượt BULK_MAX_IMAGE_BYTES) báo lỗi như ảnh decode hỏng
+                key, cached, future = None, None, Future()
+                future.set_exception(data)
+            else:
+                key = prediction_cache.key(data)
+                cached = prediction_cache.get(key)
+                future = pool.submit(_decode_for_bulk, data) if cached is None else None
+            pending.append((name, key, cached, future))
+            if len(pending) >= 2 * batch_size:
+                yield from _flush_bulk(pending, batch_size)
+        while pending:
+            yield from _flush_bulk(pending, batch_size)
+
+def iter_uploaded_files(uploads):
+    # uploads: danh sách (tên file, stream); stream được đóng khi duyệt xong
+    try:
+        for filename, stream in uploads:
+            if is_archive(filename):
+                yield from iter_archive(stream, filename)
+            elif allowed_file(filename):
+                yield secure_filename(filename), _read_limited(stream, 0, app.config['BULK_MAX_IMAGE_BYTES'])
+    finally:
+        for _, stream in uploads:
+            stream.close()
+
+def bulk_cli(argv):
+    parser = argparse.ArgumentParser(prog='app.py bulk',
+                                     description='Phân tích hàng loạt ảnh, in kết quả NDJSON ra stdout')
+    parser.add_argument('paths', nargs='+', help='ảnh, thư mục hoặc file nén zip/tar')
+    parser.add_argument('--batch-size', type=int, default=app.config['BULK_BATCH_SIZE'])
+    parser.add_argument('--workers', type=int, default=app.config['BULK_DECODE_WORKERS'])
+    args = parser.parse_args(argv)
+
+    sources = (item for path in args.paths for item in iter_path(path))
+    for row in bulk_predict(sources, batch_size=args.batch_size, workers=args.workers):
+        sys.stdout.write(json.dumps(row, ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+
+STREAM_THUMBNAIL_SIZE = (16, 16)
+
+def frame_thumbnail(data):
+    # Ảnh xám 16x16 để so sánh nhanh hai frame; JPEG được decode ở tỉ lệ 1/8
+    img = Image.open(io.BytesIO(data))
+    if img.format == 'JPEG':
+        img.draft('L', (STREAM_THUMBNAIL_SIZE[0] * 4, STREAM_THUMBNAIL_SIZE[1] * 4))
+    img = img.convert('L').resize(STREAM_THUMBNAIL_SIZE, Image.BILINEAR)
+    return np.asarray(img, dtype=np.float32) / 255.0
+
+class FrameStreamAnalyzer:
+    # Chỉ giữ frame mới nhất: frame đến khi frame trước chưa được phân tích sẽ bị bỏ
+    # (backpressure), nên thiết bị gửi theo tốc độ camera mà không dồn hàng đợi.
+    def __init__(self, diff_threshold=0.02, window=5):
+        self.diff_threshold = diff_threshold
+        self.window = deque(maxlen=max(1, window))
+        self._cond = threading.Condition()
+        self._latest = None
+        self._closed = False
+        self._last_thumbnail = None
+        self.received = 0
+        self.dropped = 0
+        self.similar = 0
+        self.analyzed = 0
+
+    def offer(self, data):
+        with self._cond:
+            self.received += 1
+            if self._latest is not None:
+                self.dropped += 1
+                metrics.inc('stream_frames_total', outcome='dropped')
+            self._latest = data
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def next_frame(self):
+        with self._cond:
+            while self._latest is None and not self._closed:
+                self._cond.wait()
+            data, self._latest = self._latest, None
+            return data
+
+    def analyze(self, data):
+        # Trả về None nếu frame gần giống frame đã phân tích gần nhất
+        thumbnail = frame_thumbnail(data)
+        if self._last_thumbnail is not None and \
+                float(np.mean(np.abs(thumbnail - self._last_thumbnail))) < self.diff_threshold:
+            self.similar += 1
+            metrics.inc('stream_frames_total', outcome='similar')
+            return None
+        self._last_thumbnail = thumbnail
+
+        with metrics.time('stage_duration_seconds', stage='preprocess'):
+            img_array = preprocess_image_stream(io.BytesIO(data))
+        probabilities = predict_probabilities(img_array)
+        self.window.append(probabilities)
+        self.analyzed += 1
+        metrics.inc('stream_frames_total', outcome='analyzed')
+
+        result = build_result(np.mean(self.window, axis=0))
+        result.update({
+            "frame": self.received,
+            "frame_class_name": model_registry.class_indices[str(int(np.argmax(probabilities)))],
+            "frame_confidence": float(np.max(probabilities)),
+            "analyzed": self.analyzed,
+            "similar": self.similar,
+            "dropped": self.dropped,
+        })
+        return result
+
+    def results(self):
+        while True:
+            data = self.next_frame()
+            if data is None:
+                return
+            try:
+                result = self.analyze(data)
+            except Exception as e:
+                yield {"frame": self.received, "error": str(e)}
+                continue
+            if result is not None:
+                yield result
+
+def new_stream_analyzer():
+    return FrameStreamAnalyzer(diff_threshold=app.config['STREAM_DIFF_THRESHOLD'],
+                               window=app.config['STREAM_SMOOTHING_WINDOW'])
+
+def iter_jpeg_frames(stream, max_frame_bytes, chunk_size=16 * 1024):
+    # Tách các ảnh JPEG (SOI ... EOI) từ luồng MJPEG multipart/x-mixed-replace
+    # hoặc các JPEG nối liền nhau; phần header của multipart được bỏ qua.
+    # Frame kết thúc ở EOI đầu tiên sau SOI, nên JPEG có thumbnail EXIF nhúng bên trong
+    # (SOI/EOI lồng nhau) sẽ bị cắt cụt; camera MJPEG như ESP32 không gửi thumbnail.
+    buf = bytearray()
+    start = -1  # vị trí SOI của frame đang đọc, -1 khi chưa thấy
+    scan = 0  # tìm tiếp từ đây để mỗi byte chỉ được quét một lần
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        buf += chunk
+        while True:
+            if start < 0:
+                start = buf.find(b'\xff\xd8', scan)
+                if start < 0:
+                    # Giữ byte cuối phòng marker bị cắt giữa hai chunk
+                    del buf[:-1]
+                    scan = 0
+                    break
+                scan = start + 2
+            end = buf.find(b'\xff\xd9', scan)
+            if end < 0:
+                del buf[:start]
+                start = 0
+                scan = max(2, len(buf) - 1)
+                if len(buf) > max_frame_bytes:
+                    raise ValueError('Frame exceeds STREAM_MAX_FRAME_BYTES')
+                break
+            yield bytes(buf[start:end + 2])
+            del buf[:end + 2]
+            start, scan = -1, 0
 
 @app.route('/', methods=['GET', 'POST'])
+@instrumented('index')
 def index():
     if request.method == 'POST':
+        # Werkzeug đọc và parse toàn bộ form multipart ở lần đầu truy cập request.files,
+        # nên upload_read được tính từ đây
+        upload_start = time.perf_counter()
         # Check if the post request has the file part
         if 'file' not in request.files:
             return redirect(request.url)
@@ -253,25 +1467,35 @@ def index():
             return redirect(request.url)
         
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
+            data = file.read()
+            metrics.observe('stage_duration_seconds', time.perf_counter() - upload_start, stage='upload_read')
+            digest = content_digest(data)
             
             # Predict disease
-            result = predict_disease(file_path)
+            top_k, tta = prediction_options(request.values)
+            result = predict_disease_bytes(data, top_k=top_k, tta_views=tta, digest=digest)
+
+            # Chỉ lưu thumbnail khi ảnh đã được phân tích thành công
+            with metrics.time('stage_duration_seconds', stage='upload_save'):
+                filename = upload_store.save(data, digest=digest)
             
-            return render_template('result.html', 
-                                  filename=filename, 
-                                  disease_name=result["disease_name"],
-                                  class_name=result["class_name"],
-                                  description=result["description"],
-                                  treatment=result["treatment"])
+            with metrics.time('stage_duration_seconds', stage='render'):
+                return render_template('result.html', 
+                                      filename=filename, 
+                                      disease_name=result["disease_name"],
+                                      class_name=result["class_name"],
+                                      description=result["description"],
+                                      treatment=result["treatment"],
+                                      confidence=result["confidence"],
+                                      top_k=result.get("top_k", []))
     
     return render_template('index.html')
 
 @app.route('/analyze_webcam', methods=['POST'])
+@instrumented('analyze_webcam')
 def analyze_webcam():
     # Đây là phần xử lý ảnh từ webcam
+    upload_start = time.perf_counter()
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'})
     
@@ -280,19 +1504,139 @@ def analyze_webcam():
         return jsonify({'error': 'No selected file'})
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        
-        # Predict disease
-        result = predict_disease(file_path)
+        # Ảnh webcam không cần lưu lại, phân tích trực tiếp từ bộ nhớ
+        data = file.read()
+        metrics.observe('stage_duration_seconds', time.perf_counter() - upload_start, stage='upload_read')
+        top_k, tta = prediction_options(request.values)
+        result = predict_disease_bytes(data, top_k=top_k, tta_views=tta)
         
         return jsonify(result)
 
-# @app.route('/analyze_esp32', methods=['POST'])
-# def analyze_esp32():
-#     # Phần này dành cho ESP32 camera, sẽ được implement sau khi cần
-#     pass
+@app.route('/analyze_bulk', methods=['POST'])
+@instrumented('analyze_bulk')
+def analyze_bulk():
+    # Nhận nhiều file (field "files") và/hoặc file nén zip/tar
+    request.max_content_length = app.config['BULK_MAX_CONTENT_LENGTH']
+    with metrics.time('stage_duration_seconds', stage='upload_read'):
+        files = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename != '']
+    if not files:
+        return jsonify({'error': 'No file part'}), 400
+
+    # Werkzeug đóng các file upload khi view trả về, trước khi response được stream;
+    # tách stream thật ra và để request đóng một stream rỗng thay thế
+    uploads = []
+    for f in files:
+        uploads.append((f.filename, f.stream))
+        f.stream = io.BytesIO()
+
+    def generate():
+        for row in bulk_predict(iter_uploaded_files(uploads)):
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/uploads/<filename>', methods=['GET'])
+def uploaded_file(filename):
+    if filename != secure_filename(filename):
+        abort(404)
+    upload_store.wait(filename)
+    return send_from_directory(os.path.abspath(upload_store.folder), filename, max_age=24 * 3600)
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    # Chỉ nhận traffic khi model đã load và warm up xong trong worker này
+    if app.config['MODEL_AUTOLOAD']:
+        model_registry.start()
+    status = model_registry.status()
+    return jsonify(status), 200 if model_registry.is_ready() else 503
+
+@app.route('/batch_stats', methods=['GET'])
+def batch_stats():
+    return jsonify(batch_predictor.stats())
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify(prediction_cache.stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if not metrics.enabled:
+        return 'Metrics are disabled\n', 404, {'Content-Type': 'text/plain; charset=utf-8'}
+    batch = batch_predictor.stats()
+    cache = prediction_cache.stats()
+    text = metrics.render(gauges=[
+        ('batch_queue_depth', 'Số ảnh đang chờ trong hàng đợi batch', batch['queue_depth']),
+        ('prediction_cache_entries', 'Số kết quả trong cache', cache['entries']),
+        ('prediction_cache_hits', 'Số lần cache hit', cache['hits']),
+        ('prediction_cache_misses', 'Số lần cache miss', cache['misses']),
+        ('model_ready', '1 nếu model đã load và warm up xong', int(model_registry.is_ready())),
+    ])
+    return text, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/analyze_esp32', methods=['POST'])
+@instrumented('analyze_esp32')
+def analyze_esp32():
+    # ESP32 camera gửi một request POST chunked chứa luồng MJPEG; server trả về
+    # NDJSON, mỗi dòng là kết quả (đã làm mượt) của một frame được phân tích.
+    request.max_content_length = None
+    stream = request.stream
+    analyzer = new_stream_analyzer()
+    max_frame_bytes = app.config['STREAM_MAX_FRAME_BYTES']
+
+    def read_frames():
+        try:
+            for frame in iter_jpeg_frames(stream, max_frame_bytes):
+                analyzer.offer(frame)
+        except Exception:
+            app.logger.exception('ESP32 stream read failed')
+        finally:
+            analyzer.close()
+
+    reader = threading.Thread(target=read_frames, name='esp32-reader', daemon=True)
+    reader.start()
+
+    def generate():
+        try:
+            for result in analyzer.results():
+                yield json.dumps(result, ensure_ascii=False) + '\n'
+        finally:
+            analyzer.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route('/ws/stream')
+    def stream_ws(ws):
+        # Trình duyệt / thiết bị gửi frame JPEG dạng binary, nhận lại kết quả JSON
+        analyzer = new_stream_analyzer()
+
+        def read_frames():
+            try:
+                while True:
+                    data = ws.receive()
+                    if data is None:
+                        break
+                    if isinstance(data, bytes):
+                        analyzer.offer(data)
+            except ConnectionClosed:
+                pass
+            except Exception:
+                app.logger.exception('WebSocket stream read failed')
+            finally:
+                analyzer.close()
+
+        threading.Thread(target=read_frames, name='ws-reader', daemon=True).start()
+        for result in analyzer.results():
+            ws.send(json.dumps(result, ensure_ascii=False))
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0')
+    if len(sys.argv) > 1 and sys.argv[1] == 'bulk':
+        bulk_cli(sys.argv[2:])
+    else:
+        app.run(debug=True, host='0.0.0.0')
@@ -0,0 +1,309 @@
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+import threading
+import urllib.request
+import numpy as np
+
+from benchmarks.stand_in import build_stand_in_model, build_stand_in_tflite, synthetic_leaf, write_images
+
+# Benchmark cho dịch vụ nhận diện, chạy từ thư mục gốc của repo:
+#
+#   python -m benchmarks.bench all --output bench.json
+#   python -m benchmarks.bench micro --backend tflite
+#   python -m benchmarks.bench load --url http://localhost:8080 --server-pid 1234
+#
+# Mặc định dùng model thay thế (benchmarks/stand_in.py) và ảnh tổng hợp nên chạy offline.
+# Kết quả là JSON để so sánh giữa các commit.
+
+RESOLUTIONS = [(224, 224), (640, 480), (1280, 960), (4032, 3024)]
+BATCH_SIZES = [1, 2, 4, 8, 16, 32]
+
+
+def summarize(samples):
+    samples = np.asarray(samples) * 1000.0
+    return {
+        "n": int(len(samples)),
+        "mean_ms": float(np.mean(samples)),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+    }
+
+
+def timeit(fn, repeat, warmup=2):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def peak_rss_mb(pid=None):
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    # VmHWM: RSS lớn nhất của process server (Linux)
+    with open('/proc/%d/status' % pid) as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024.0
+    return None
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def setup_app(workdir, use_real_model=False, enable_cache=False, backend='keras'):
+    # Phải đặt biến môi trường trước khi import app
+    os.environ['INFERENCE_BACKEND'] = backend
+    if not use_real_model:
+        keras_path = build_stand_in_model(os.path.join(workdir, 'stand_in.h5'))
+        os.environ['MODEL_PATH'] = keras_path
+        if backend == 'tflite':
+            os.environ['TFLITE_MODEL_PATH'] = build_stand_in_tflite(keras_path, os.path.join(workdir, 'stand_in.tflite'))
+    if not enable_cache:
+        # Ảnh lặp lại sẽ trúng cache và làm sai số đo
+        os.environ['PREDICTION_CACHE_SIZE'] = '0'
+    os.environ.setdefault('SAVE_UPLOADS_ASYNC', '1')
+    os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+
+    import app as app_module
+    app_module.model_registry.get()
+    return app_module
+
+
+def bench_preprocess(app_module, workdir, repeat):
+    results = []
+    for size in RESOLUTIONS:
+        path = write_images(os.path.join(workdir, 'preprocess'), 1, size)[0]
+        with open(path, 'rb') as f:
+            data = f.read()
+        results.append({
+            "resolution": '%dx%d' % size,
+            "bytes": len(data),
+            "preprocess_image": summarize(timeit(lambda: app_module.preprocess_image(path), repeat)),
+            "preprocess_image_stream": summarize(timeit(
+                lambda: app_module.preprocess_image_stream(io.BytesIO(data)), repeat)),
+        })
+    return results
+
+
+def bench_predict(app_module, repeat):
+    # Gọi model trực tiếp (không qua BatchPredictor) để thấy chi phí theo kích thước batch
+    model = app_module.model_registry.get()
+    rng = np.random.default_rng(0)
+    results = []
+    for batch_size in BATCH_SIZES:
+        batch = rng.random((batch_size, 224, 224, 3), dtype=np.float32)
+        samples = timeit(lambda: model.predict(batch, verbose=0), repeat)
+        summary = summarize(samples)
+        summary["batch_size"] = batch_size
+        summary["images_per_sec"] = batch_size / float(np.mean(samples))
+        results.append(summary)
+
+    # predict_disease_bytes đầy đủ như route: decode trong bộ nhớ, tiền xử lý, qua hàng đợi batch
+    end_to_end = []
+    for size in RESOLUTIONS:
+        data = synthetic_leaf(*size)
+        summary = summarize(timeit(lambda: app_module.predict_disease_bytes(data), repeat))
+        summary["resolution"] = '%dx%d' % size
+        end_to_end.append(summary)
+    return {"model_predict": results, "predict_disease_bytes": end_to_end}
+
+
+def bench_serving(app_module, args):
+    # N thread cùng gọi predict_disease_bytes, giống N request đồng thời trong một worker;
+    # đo độ trễ, thông lượng và kích thước batch thực tế mà BatchPredictor gom được
+    images = [synthetic_leaf(*args.load_resolution, seed=i) for i in range(args.num_images)]
+    results = []
+    for concurrency in args.concurrency:
+        latencies = []
+        lock = threading.Lock()
+
+        def worker(offset):
+            local = []
+            for i in range(args.repeat):
+                data = images[(offset + i) % len(images)]
+                start = time.perf_counter()
+                app_module.predict_disease_bytes(data)
+                local.append(time.perf_counter() - start)
+            with lock:
+                latencies.extend(local)
+
+        before = app_module.batch_predictor.stats()
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        after = app_module.batch_predictor.stats()
+
+        batches = after["batches"] - before["batches"]
+        summary = summarize(latencies)
+        summary.update({
+            "concurrency": concurrency,
+            "resolution": '%dx%d' % tuple(args.load_resolution),
+            "images_per_sec": len(latencies) / elapsed,
+            "model_calls": batches,
+            "mean_batch_size": (after["images"] - before["images"]) / batches if batches else 0.0,
+        })
+        results.append(summary)
+    return results
+
+
+def _multipart(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = b''.join([
+        ('--%s\r\n' % boundary).encode(),
+        ('Content-Disposition: form-data; name="%s"; filename="%s"\r\n' % (field, filename)).encode(),
+        b'Content-Type: image/jpeg\r\n\r\n',
+        data,
+        ('\r\n--%s--\r\n' % boundary).encode(),
+    ])
+    return body, 'multipart/form-data; boundary=%s' % boundary
+
+
+def _client_for(app_module, url):
+    if url is None:
+        client = app_module.app.test_client()
+
+        def send(route, data):
+            response = client.post(route, data={'file': (io.BytesIO(data), 'leaf.jpg')},
+                                   content_type='multipart/form-data')
+            return response.status_code
+        return send
+
+    def send(route, data):
+        body, content_type = _multipart('file', 'leaf.jpg', data)
+        request = urllib.request.Request(url.rstrip('/') + route, data=body, method='POST',
+                                         headers={'Content-Type': content_type})
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            return response.status
+    return send
+
+
+def run_load(app_module, images, route, concurrency, requests_per_client, url=None):
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker(offset):
+        send = _client_for(app_module, url)
+        local = []
+        for i in range(requests_per_client):
+            data = images[(offset + i) % len(images)]
+            start = time.perf_counter()
+            try:
+                status = send(route, data)
+                if status >= 400:
+                    raise RuntimeError('HTTP %d' % status)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(latencies) if latencies else {"n": 0}
+    summary.update({
+        "route": route,
+        "concurrency": concurrency,
+        "requests_per_sec": len(latencies) / elapsed,
+        "errors": len(errors),
+        "elapsed_sec": elapsed,
+    })
+    return summary
+
+
+def bench_load(app_module, args):
+    images = [synthetic_leaf(*args.load_resolution, seed=i) for i in range(args.num_images)]
+    results = []
+    for route in args.routes:
+        for concurrency in args.concurrency:
+            results.append(run_load(app_module, images, route, concurrency, args.requests, url=args.url))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark tiền xử lý, model và các route Flask')
+    parser.add_argument('suite', choices=['micro', 'load', 'all'], nargs='?', default='all')
+    parser.add_argument('--output', help='ghi kết quả JSON vào file (mặc định: stdout)')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--real-model', action='store_true', help='dùng model thật thay cho model thay thế')
+    parser.add_argument('--backend', choices=['keras', 'tflite'], default=os.environ.get('INFERENCE_BACKEND', 'keras'),
+                        help='backend suy luận; tflite với --real-model dùng TFLITE_MODEL_PATH')
+    parser.add_argument('--cache', action='store_true', help='giữ prediction cache khi đo')
+    parser.add_argument('--url', help='chạy load test vào server đang chạy thay vì Flask test client')
+    parser.add_argument('--server-pid', type=int, help='pid của server để đo peak RSS khi dùng --url')
+    parser.add_argument('--routes', nargs='+', default=['/analyze_webcam', '/'])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8],
+                        help='số thread / client đồng thời cho serving và load')
+    parser.add_argument('--requests', type=int, default=50, help='số request mỗi client')
+    parser.add_argument('--num-images', type=int, default=16)
+    parser.add_argument('--load-resolution', type=int, nargs=2, default=[640, 480], metavar=('W', 'H'))
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='plant-bench-') as workdir:
+        app_module = None
+        if args.suite in ('micro', 'all') or args.url is None:
+            app_module = setup_app(workdir, use_real_model=args.real_model, enable_cache=args.cache,
+                                   backend=args.backend)
+
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "stand_in_model": not args.real_model,
+                "config": {k: os.environ.get(k) for k in (
+                    'INFERENCE_BACKEND', 'BATCH_MAX_SIZE', 'BATCH_MAX_WAIT_MS', 'TFLITE_NUM_THREADS',
+                    'PREDICTION_CACHE_SIZE')},
+            },
+        }
+        if args.suite in ('micro', 'all'):
+            report["preprocess"] = bench_preprocess(app_module, workdir, args.repeat)
+            report["predict"] = bench_predict(app_module, args.repeat)
+            report["serving"] = bench_serving(app_module, args)
+        if args.suite in ('load', 'all'):
+            report["load"] = bench_load(app_module, args)
+        report["peak_rss_mb"] = peak_rss_mb()
+        if args.server_pid:
+            report["server_peak_rss_mb"] = peak_rss_mb(args.server_pid)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        sys.stdout.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import io
+import os
+import json
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+# Model thay thế và ảnh lá tổng hợp để benchmark chạy offline trên CPU,
+# không cần file 'model_epoch_15 (1).h5' thật. Model có cùng input (224, 224, 3)
+# và output softmax cùng số lớp với class_indices_moi.json.
+
+CLASS_INDICES_PATH = 'model/class_indices_moi.json'
+
+
+def num_classes():
+    with open(CLASS_INDICES_PATH, 'r') as f:
+        return len(json.load(f))
+
+
+def build_stand_in_model(path, seed=0):
+    import tensorflow as tf
+
+    tf.keras.utils.set_random_seed(seed)
+    model = tf.keras.Sequential([
+        tf.keras.layers.Input(shape=(224, 224, 3)),
+        tf.keras.layers.Conv2D(16, 3, strides=2, activation='relu'),
+        tf.keras.layers.Conv2D(32, 3, strides=2, activation='relu'),
+        tf.keras.layers.MaxPooling2D(4),
+        tf.keras.layers.Conv2D(64, 3, activation='relu'),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(num_classes(), activation='softmax'),
+    ])
+    model.save(path)
+    return path
+
+
+def build_stand_in_tflite(keras_path, path):
+    # Chuyển model thay thế sang TFLite float32 để benchmark INFERENCE_BACKEND=tflite
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(tf.keras.models.load_model(keras_path))
+    with open(path, 'wb') as f:
+        f.write(converter.convert())
+    return path
+
+
+def synthetic_leaf(width, height, seed=0, quality=90):
+    # Lá xanh hình elip với gân lá và vài đốm bệnh nâu trên nền đất, trả về bytes JPEG
+    rng = np.random.default_rng(seed)
+    background = tuple(int(c) for c in rng.integers(60, 140, size=3))
+    img = Image.new('RGB', (width, height), background)
+    draw = ImageDraw.Draw(img)
+
+    cx, cy = width / 2, height / 2
+    rx, ry = width * rng.uniform(0.3, 0.45), height * rng.uniform(0.2, 0.35)
+    green = (int(rng.integers(30, 90)), int(rng.integers(120, 200)), int(rng.integers(30, 90)))
+    draw.ellipse([cx - rx, cy - ry, cx + rx, cy + ry], fill=green)
+    line_width = max(1, width // 200)
+    draw.line([cx - rx, cy, cx + rx, cy], fill=(200, 220, 160), width=line_width)
+    for i in range(1, 6):
+        x = cx - rx + 2 * rx * i / 6
+        draw.line([x, cy, x + rx / 6, cy - ry * 0.8], fill=(200, 220, 160), width=line_width)
+        draw.line([x, cy, x + rx / 6, cy + ry * 0.8], fill=(200, 220, 160), width=line_width)
+    for _ in range(int(rng.integers(0, 12))):
+        x, y = cx + rng.uniform(-0.8, 0.8) * rx, cy + rng.uniform(-0.6, 0.6) * ry
+        r = rng.uniform(0.01, 0.04) * width
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=(110, 70, 30))
+
+    noise = rng.normal(0, 8, size=(height, width, 3))
+    pixels = np.clip(np.asarray(img, dtype=np.float32) + noise, 0, 255).astype(np.uint8)
+    img = Image.fromarray(pixels).filter(ImageFilter.GaussianBlur(radius=1))
+
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=quality)
+    return buf.getvalue()
+
+
+def write_images(directory, count, size, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, 'leaf_%dx%d_%03d.jpg' % (size[0], size[1], i))
+        with open(path, 'wb') as f:
+            f.write(synthetic_leaf(size[0], size[1], seed=seed + i))
+        paths.append(path)
+    return paths
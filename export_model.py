@@ -0,0 +1,182 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+# Chuyển model Keras (.h5) sang TFLite để chạy trên CPU (Cloud Run) nhẹ hơn,
+# và so sánh độ chính xác / độ trễ của các biến thể với model Keras gốc.
+#
+#   python export_model.py export --variants float32 float16 dynamic int8 --calibration-dir data/
+#   python export_model.py compare model/model_*.tflite --images data/
+#
+# Chạy app với model đã xuất: INFERENCE_BACKEND=tflite TFLITE_MODEL_PATH=model/model_float16.tflite
+
+DEFAULT_MODEL_PATH = 'model/model_epoch_15 (1).h5'
+VARIANTS = ('float32', 'float16', 'dynamic', 'int8')
+
+# Import app chỉ để dùng lại tiền xử lý, không cần load model của server
+os.environ.setdefault('MODEL_AUTOLOAD', '0')
+
+
+def load_images(paths, limit=None):
+    # Dùng đúng pipeline tiền xử lý của app để dữ liệu calibration / so sánh khớp với lúc serve
+    from app import IMAGE_SIZE, iter_path, preprocess_image_stream
+
+    names, arrays = [], []
+    for path in paths:
+        for name, data in iter_path(path):
+            out = np.empty(IMAGE_SIZE + (3,), dtype=np.float32)
+            try:
+                if isinstance(data, Exception):
+                    raise data
+                arrays.append(preprocess_image_stream(io.BytesIO(data), out=out))
+            except Exception as e:
+                print('Bỏ qua %s: %s' % (name, e), file=sys.stderr)
+                continue
+            names.append(name)
+            if limit and len(arrays) >= limit:
+                return names, np.stack(arrays)
+    if not arrays:
+        raise SystemExit('Không tìm thấy ảnh nào trong %s' % ', '.join(paths))
+    return names, np.stack(arrays)
+
+
+def convert(keras_model, variant, calibration=None):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    if variant == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == 'dynamic':
+        # Dynamic-range: trọng số int8, activation vẫn float
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif variant == 'int8':
+        if calibration is None:
+            raise SystemExit('Biến thể int8 cần --calibration-dir')
+
+        def representative_dataset():
+            for image in calibration:
+                yield [image[np.newaxis]]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # Giữ input/output float32 để app không cần đổi tiền xử lý
+        converter.inference_input_type = tf.float32
+        converter.inference_output_type = tf.float32
+    elif variant != 'float32':
+        raise SystemExit('Biến thể không hợp lệ: %s' % variant)
+    return converter.convert()
+
+
+def export(args):
+    from tensorflow.keras.models import load_model
+
+    keras_model = load_model(args.model)
+    calibration = None
+    if 'int8' in args.variants and args.calibration_dir:
+        _, calibration = load_images(args.calibration_dir, limit=args.num_calibration)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for variant in args.variants:
+        start = time.perf_counter()
+        flatbuffer = convert(keras_model, variant, calibration)
+        output_path = os.path.join(args.output_dir, 'model_%s.tflite' % variant)
+        with open(output_path, 'wb') as f:
+            f.write(flatbuffer)
+        print('%-8s -> %s (%.1f MB, %.1fs)' % (
+            variant, output_path, len(flatbuffer) / 1e6, time.perf_counter() - start))
+
+
+def _timed_predict(predict, images, batch_size):
+    outputs, latencies = [], []
+    for i in range(0, len(images), batch_size):
+        batch = images[i:i + batch_size]
+        start = time.perf_counter()
+        outputs.append(np.asarray(predict(batch)))
+        latencies.append((time.perf_counter() - start) / len(batch))
+    return np.concatenate(outputs), latencies
+
+
+def compare(args):
+    from tensorflow.keras.models import load_model
+    from app import TFLiteModel, model_registry
+
+    class_indices = model_registry.load_class_indices()
+    names, images = load_images(args.images, limit=args.limit)
+    keras_model = load_model(args.model)
+    # Chạy một lần để warm up graph trước khi đo
+    keras_model.predict(images[:1], verbose=0)
+    baseline, baseline_latencies = _timed_predict(
+        lambda batch: keras_model.predict(batch, verbose=0), images, args.batch_size)
+    baseline_top1 = np.argmax(baseline, axis=1)
+
+    report = [{
+        "model": args.model,
+        "backend": "keras",
+        "size_mb": os.path.getsize(args.model) / 1e6,
+        "mean_latency_ms": float(np.mean(baseline_latencies) * 1000),
+        "top1_agreement": 1.0,
+        "mismatches": [],
+    }]
+    for path in args.tflite_models:
+        tflite_model = TFLiteModel(path, args.num_threads, batch_size=args.batch_size)
+        tflite_model.predict(images[:1])
+        outputs, latencies = _timed_predict(tflite_model.predict, images, args.batch_size)
+        top1 = np.argmax(outputs, axis=1)
+        mismatches = [{
+            "file": names[i],
+            "keras": class_indices[str(baseline_top1[i])],
+            "tflite": class_indices[str(top1[i])],
+        } for i in np.flatnonzero(top1 != baseline_top1)]
+        report.append({
+            "model": path,
+            "backend": "tflite",
+            "size_mb": os.path.getsize(path) / 1e6,
+            "mean_latency_ms": float(np.mean(latencies) * 1000),
+            "top1_agreement": float(np.mean(top1 == baseline_top1)),
+            "max_abs_diff": float(np.max(np.abs(outputs - baseline))),
+            "mismatches": mismatches,
+        })
+
+    json.dump({"images": len(images), "batch_size": args.batch_size, "results": report},
+              sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write('\n')
+    if args.require_same_top1 and any(r["top1_agreement"] < 1.0 for r in report):
+        sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Xuất và kiểm tra model TFLite cho CPU')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='chuyển .h5 sang TFLite')
+    export_parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    export_parser.add_argument('--output-dir', default='model')
+    export_parser.add_argument('--variants', nargs='+', choices=VARIANTS, default=['float32', 'float16', 'dynamic'])
+    export_parser.add_argument('--calibration-dir', nargs='+',
+                               help='ảnh mẫu (thư mục hoặc file nén) để calibrate int8')
+    export_parser.add_argument('--num-calibration', type=int, default=200)
+    export_parser.set_defaults(func=export)
+
+    compare_parser = subparsers.add_parser('compare', help='so sánh độ chính xác và độ trễ với Keras')
+    compare_parser.add_argument('tflite_models', nargs='+')
+    compare_parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    compare_parser.add_argument('--images', nargs='+', required=True)
+    compare_parser.add_argument('--limit', type=int, default=500)
+    compare_parser.add_argument('--batch-size', type=int, default=1)
+    compare_parser.add_argument('--num-threads', type=int, default=os.cpu_count())
+    compare_parser.add_argument('--require-same-top1', action='store_true',
+                                help='trả về mã lỗi nếu top-1 khác model Keras')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
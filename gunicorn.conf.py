@@ -0,0 +1,13 @@
+import os
+
+# Cấu hình gunicorn, được đọc tự động khi chạy trong thư mục app.
+# MODEL_PRELOAD=1: import app và đọc file model TFLite một lần trong master trước khi fork,
+# các worker dùng chung trang bộ nhớ của flatbuffer thay vì mỗi worker đọc một bản.
+preload_app = os.environ.get('MODEL_PRELOAD', '0') == '1'
+
+
+def post_fork(server, worker):
+    # Tạo interpreter, load và warm up model trong worker, không phải trong master
+    if server.cfg.preload_app:
+        import app
+        app.model_registry.start()
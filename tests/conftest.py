@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+import threading
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Các test chỉ dùng những phần không cần TensorFlow hay file model .h5.
+# app đọc model/class_indices_moi.json theo đường dẫn tương đối nên chạy từ thư mục gốc.
+os.environ.setdefault('MODEL_AUTOLOAD', '0')
+os.environ.setdefault('UPLOAD_FOLDER', tempfile.mkdtemp(prefix='plant-test-uploads-'))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+class StubModel:
+    # Thay cho model Keras / TFLite: lớp dự đoán là độ sáng trung bình của ảnh,
+    # nên ảnh một màu có kết quả biết trước mà không cần TensorFlow
+    def __init__(self, num_classes):
+        self.num_classes = num_classes
+        self.batch_sizes = []
+
+    def class_for(self, image):
+        return int(round(float(np.mean(image)) * (self.num_classes - 1)))
+
+    def predict(self, batch, **kwargs):
+        batch = np.asarray(batch)
+        self.batch_sizes.append(len(batch))
+        out = np.full((len(batch), self.num_classes), 0.1 / (self.num_classes - 1), dtype=np.float32)
+        for i, image in enumerate(batch):
+            out[i, self.class_for(image)] = 0.9
+        return out
+
+
+@pytest.fixture
+def stub_model(monkeypatch):
+    import app
+
+    registry = app.model_registry
+    model = StubModel(len(registry.load_class_indices()))
+    ready = threading.Event()
+    ready.set()
+    monkeypatch.setattr(registry, 'model', model)
+    monkeypatch.setattr(registry, 'state', 'ready')
+    monkeypatch.setattr(registry, '_pid', os.getpid())
+    monkeypatch.setattr(registry, '_ready', ready)
+    app.prediction_cache._entries.clear()
+    yield model
+    app.prediction_cache._entries.clear()
@@ -0,0 +1,117 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app import BatchPredictor
+
+
+def _echo_model(calls):
+    # Trả về giá trị pixel đầu tiên của mỗi ảnh để kiểm tra kết quả về đúng caller
+    def predict(batch):
+        calls.append(len(batch))
+        return batch.reshape(len(batch), -1)[:, :1].copy()
+    return predict
+
+
+def _image(value):
+    return np.full((4, 4, 3), value, dtype=np.float32)
+
+
+def test_each_caller_gets_its_own_result():
+    calls = []
+    predictor = BatchPredictor(_echo_model(calls), max_batch_size=4, max_wait_ms=20)
+    results = {}
+
+    def worker(i):
+        results[i] = predictor.predict(_image(i))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert {i: float(r[0]) for i, r in results.items()} == {i: float(i) for i in range(10)}
+    assert sum(calls) == 10
+    assert max(calls) <= 4
+
+
+def test_predict_many_runs_in_one_forward_pass():
+    calls = []
+    predictor = BatchPredictor(_echo_model(calls), max_batch_size=8, max_wait_ms=0)
+    images = np.stack([_image(i) for i in range(5)])
+
+    result = predictor.predict_many(images)
+
+    assert result[:, 0].tolist() == [0, 1, 2, 3, 4]
+    assert calls == [5]
+
+
+def test_predict_many_splits_groups_larger_than_max_batch_size():
+    calls = []
+    predictor = BatchPredictor(_echo_model(calls), max_batch_size=2, max_wait_ms=0)
+    images = np.stack([_image(i) for i in range(5)])
+
+    result = predictor.predict_many(images)
+
+    assert result[:, 0].tolist() == [0, 1, 2, 3, 4]
+    assert calls == [2, 2, 1]
+
+
+def _wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_interactive_requests_run_before_queued_bulk_chunks():
+    release = threading.Event()
+    calls = []
+
+    def model(batch):
+        release.wait(5)
+        calls.append(batch[:, 0, 0, 0].tolist())
+        return batch.reshape(len(batch), -1)[:, :1].copy()
+
+    predictor = BatchPredictor(model, max_batch_size=2, max_wait_ms=0)
+    bulk = threading.Thread(target=predictor.predict_many,
+                            args=(np.stack([_image(i) for i in range(6)]), BatchPredictor.PRIORITY_BULK))
+    bulk.start()
+    # Phần đầu của bulk đang chạy, hai phần còn lại chờ trong hàng đợi
+    _wait_for(lambda: predictor._queue.qsize() == 2)
+    results = []
+    interactive = threading.Thread(target=lambda: results.append(predictor.predict(_image(9))))
+    interactive.start()
+    _wait_for(lambda: predictor._queue.qsize() == 3)
+    release.set()
+    bulk.join()
+    interactive.join()
+
+    assert calls == [[0, 1], [9], [2, 3], [4, 5]]
+    assert float(results[0][0]) == 9
+
+
+def test_stats_record_batch_sizes():
+    predictor = BatchPredictor(_echo_model([]), max_batch_size=8, max_wait_ms=0)
+    predictor.predict(_image(1))
+    predictor.predict_many(np.stack([_image(2), _image(3)]))
+
+    stats = predictor.stats()
+    assert stats["batches"] == 2
+    assert stats["images"] == 3
+    assert stats["batch_size_histogram"] == {1: 1, 2: 1}
+
+
+def test_model_errors_reach_every_caller():
+    def failing(batch):
+        raise RuntimeError('boom')
+
+    predictor = BatchPredictor(failing, max_batch_size=4, max_wait_ms=0)
+    with pytest.raises(RuntimeError, match='boom'):
+        predictor.predict(_image(0))
+    # Thread của batcher vẫn chạy tiếp sau lỗi
+    with pytest.raises(RuntimeError, match='boom'):
+        predictor.predict_many(np.stack([_image(0), _image(1)]))
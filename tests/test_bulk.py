@@ -0,0 +1,110 @@
+import io
+import json
+import tarfile
+import zipfile
+
+import pytest
+from PIL import Image
+
+import app
+from app import ImageTooLarge, bulk_predict, iter_archive
+
+
+def _png(gray):
+    buf = io.BytesIO()
+    Image.new('RGB', (32, 24), (gray, gray, gray)).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def _zip(members, compression=zipfile.ZIP_DEFLATED):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', compression) as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+def _tar(members):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w:gz') as tar:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    buf.seek(0)
+    return buf
+
+
+@pytest.mark.parametrize('make, filename', [(_zip, 'leaves.zip'), (_tar, 'leaves.tar.gz')])
+def test_iter_archive_yields_images_and_size_errors(make, filename):
+    members = [('a.jpg', _png(10)), ('notes.txt', b'skip'), ('dir/b.png', _png(20)), ('big.jpg', b'x' * 1001)]
+
+    items = list(iter_archive(make(members), filename, max_bytes=1000))
+
+    assert [name for name, _ in items] == ['a.jpg', 'dir/b.png', 'big.jpg']
+    assert items[0][1] == members[0][1]
+    assert items[1][1] == members[2][1]
+    assert isinstance(items[2][1], ImageTooLarge)
+
+
+def test_rows_keep_input_order_with_error_rows(stub_model):
+    grays = [0, 255, 64, 128, 192, 32, 224]
+    sources = [('img%d.png' % i, _png(g)) for i, g in enumerate(grays)]
+    sources.insert(2, ('broken.jpg', b'not an image'))
+    sources.insert(5, ('huge.jpg', ImageTooLarge('Image is larger than 10 bytes')))
+
+    rows = list(bulk_predict(iter(sources), batch_size=2, workers=2))
+
+    assert [row["file"] for row in rows] == [name for name, _ in sources]
+    class_indices = app.model_registry.class_indices
+    expected = [class_indices[str(stub_model.class_for(g / 255.0))] for g in grays]
+    assert [row["class_name"] for row in rows if "error" not in row] == expected
+    assert "error" in rows[2] and "error" in rows[5]
+    assert "larger than" in rows[5]["error"]
+    assert max(stub_model.batch_sizes) <= app.batch_predictor.max_batch_size
+
+
+def test_cached_images_skip_the_model(stub_model, monkeypatch):
+    monkeypatch.setattr(app.prediction_cache, 'max_entries', 16)
+    sources = [('a.png', _png(50)), ('b.png', _png(100))]
+    first = list(bulk_predict(iter(sources)))
+    calls = len(stub_model.batch_sizes)
+
+    assert list(bulk_predict(iter(sources))) == first
+    assert len(stub_model.batch_sizes) == calls
+
+
+def test_model_failures_become_error_rows(stub_model, monkeypatch):
+    def fail(batch, **kwargs):
+        raise RuntimeError('model exploded')
+
+    monkeypatch.setattr(stub_model, 'predict', fail)
+    rows = list(bulk_predict(iter([('a.png', _png(1)), ('b.png', _png(2))])))
+
+    assert rows == [{"file": "a.png", "error": "model exploded"}, {"file": "b.png", "error": "model exploded"}]
+
+
+def test_bulk_route_accepts_archives_over_max_content_length(stub_model):
+    # Phần đệm không nén làm request lớn hơn MAX_CONTENT_LENGTH (16MB) của các route khác
+    padding = b'\0' * (app.app.config['MAX_CONTENT_LENGTH'] + 1024)
+    archive = _zip([('padding.txt', padding), ('leaf.png', _png(128))], compression=zipfile.ZIP_STORED).getvalue()
+    client = app.app.test_client()
+
+    response = client.post('/analyze_bulk', data={'files': [(io.BytesIO(archive), 'leaves.zip'),
+                                                            (io.BytesIO(_png(0)), 'single.png')]},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.get_data().splitlines()]
+    assert [row["file"] for row in rows] == ['leaf.png', 'single.png']
+    assert all("class_name" in row for row in rows)
+
+    response = client.post('/analyze_webcam', data={'file': (io.BytesIO(archive), 'leaves.jpg')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 413
+
+
+def test_bulk_route_requires_files(stub_model):
+    response = app.app.test_client().post('/analyze_bulk', data={}, content_type='multipart/form-data')
+    assert response.status_code == 400
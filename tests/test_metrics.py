@@ -0,0 +1,111 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import app
+from app import Metrics
+
+
+def _value(metrics, name, **labels):
+    return metrics._values.get((name, tuple(sorted(labels.items()))), 0)
+
+
+def _histogram_count(metrics, name, **labels):
+    histogram = metrics._histograms.get((name, tuple(sorted(labels.items()))))
+    return 0 if histogram is None else histogram[2]
+
+
+def _jpeg(gray=128):
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 48), (gray, gray, gray)).save(buf, format='JPEG')
+    return buf.getvalue()
+
+
+@pytest.fixture
+def fresh_metrics(monkeypatch):
+    metrics = Metrics()
+    monkeypatch.setattr(app, 'metrics', metrics)
+    return metrics
+
+
+def test_render_counters_gauges_and_histograms():
+    metrics = Metrics()
+    metrics.inc('requests_total', endpoint='index', status=200)
+    metrics.inc('requests_total', endpoint='index', status=200)
+    metrics.inc('predictions_total', class_name='Tomato "x"\\y')
+    metrics.observe('stage_duration_seconds', 0.003, stage='preprocess')
+    metrics.observe('stage_duration_seconds', 0.2, stage='preprocess')
+
+    lines = metrics.render(gauges=[('model_ready', 'ready', 1)]).splitlines()
+
+    assert '# TYPE requests_total counter' in lines
+    assert 'requests_total{endpoint="index",status="200"} 2.0' in lines
+    assert 'predictions_total{class_name="Tomato \\"x\\"\\\\y"} 1.0' in lines
+    assert 'stage_duration_seconds_bucket{stage="preprocess",le="0.0025"} 0' in lines
+    assert 'stage_duration_seconds_bucket{stage="preprocess",le="0.005"} 1' in lines
+    assert 'stage_duration_seconds_bucket{stage="preprocess",le="0.25"} 2' in lines
+    assert 'stage_duration_seconds_bucket{stage="preprocess",le="+Inf"} 2' in lines
+    assert 'stage_duration_seconds_count{stage="preprocess"} 2' in lines
+    assert lines[-3:] == ['# HELP model_ready ready', '# TYPE model_ready gauge', 'model_ready 1.0']
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics(enabled=False)
+    metrics.inc('requests_total', endpoint='index', status=200)
+    metrics.observe('model_batch_size', 4)
+    with metrics.time('stage_duration_seconds', stage='render'):
+        pass
+    assert not metrics._values and not metrics._histograms
+
+
+def test_instrumented_records_status_and_stages(stub_model, fresh_metrics):
+    client = app.app.test_client()
+    response = client.post('/analyze_webcam', data={'file': (io.BytesIO(_jpeg()), 'leaf.jpg')},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert _value(fresh_metrics, 'requests_total', endpoint='analyze_webcam', status=200) == 1
+    assert _value(fresh_metrics, 'requests_in_flight', endpoint='analyze_webcam') == 0
+    assert _histogram_count(fresh_metrics, 'request_duration_seconds', endpoint='analyze_webcam') == 1
+    for stage in ('upload_read', 'preprocess', 'inference', 'model_predict'):
+        assert _histogram_count(fresh_metrics, 'stage_duration_seconds', stage=stage) == 1
+
+
+def test_instrumented_records_the_status_flask_sends(stub_model, fresh_metrics):
+    # View trả về None với file không được hỗ trợ, Flask gửi 500
+    client = app.app.test_client()
+    response = client.post('/analyze_webcam', data={'file': (io.BytesIO(b'BM'), 'leaf.bmp')},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 500
+    assert _value(fresh_metrics, 'requests_total', endpoint='analyze_webcam', status=500) == 1
+    assert _value(fresh_metrics, 'requests_total', endpoint='analyze_webcam', status=200) == 0
+    assert _value(fresh_metrics, 'requests_in_flight', endpoint='analyze_webcam') == 0
+
+
+def test_streamed_responses_finish_when_the_stream_closes(stub_model, fresh_metrics):
+    client = app.app.test_client()
+    response = client.post('/analyze_bulk', data={'files': [(io.BytesIO(_jpeg()), 'a.jpg')]},
+                           content_type='multipart/form-data', buffered=False)
+    assert _value(fresh_metrics, 'requests_in_flight', endpoint='analyze_bulk') == 1
+    assert _value(fresh_metrics, 'requests_total', endpoint='analyze_bulk', status=200) == 0
+
+    body = response.get_data()
+    response.close()
+
+    assert body.count(b'\n') == 1
+    assert _value(fresh_metrics, 'requests_in_flight', endpoint='analyze_bulk') == 0
+    assert _value(fresh_metrics, 'requests_total', endpoint='analyze_bulk', status=200) == 1
+
+
+def test_cache_hits_count_as_predictions(stub_model, fresh_metrics, monkeypatch):
+    monkeypatch.setattr(app.prediction_cache, 'max_entries', 16)
+    data = _jpeg()
+    first = app.predict_disease_bytes(data)
+    second = app.predict_disease_bytes(data)
+
+    assert first == second
+    assert stub_model.batch_sizes == [1]
+    assert _value(fresh_metrics, 'predictions_total', class_name=first["class_name"]) == 2
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import app
+from app import ModelRegistry
+
+CLASS_INDICES_PATH = 'model/class_indices_moi.json'
+
+
+class FakeTFLiteModel:
+    def __init__(self, model_path, num_threads=None, batch_size=1, model_content=None):
+        self.model_content = model_content
+        self.calls = []
+
+    def predict(self, batch, **kwargs):
+        self.calls.append(len(batch))
+        return np.zeros((len(batch), 2), dtype=np.float32)
+
+
+def test_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        ModelRegistry('onnx', 'model.onnx', CLASS_INDICES_PATH)
+
+
+def test_loads_and_warms_up_in_background(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'TFLiteModel', FakeTFLiteModel)
+    model_path = tmp_path / 'model.tflite'
+    model_path.write_bytes(b'flatbuffer')
+    registry = ModelRegistry('tflite', str(model_path), CLASS_INDICES_PATH)
+
+    model = registry.get(timeout=5)
+
+    assert isinstance(model, FakeTFLiteModel)
+    assert model.calls == [1]
+    assert model.model_content is None
+    assert registry.is_ready()
+    assert registry.status()["state"] == 'ready'
+    assert registry.class_indices["0"]
+
+
+def test_preload_reads_the_flatbuffer_without_building_an_interpreter(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'TFLiteModel', FakeTFLiteModel)
+    model_path = tmp_path / 'model.tflite'
+    model_path.write_bytes(b'flatbuffer')
+    registry = ModelRegistry('tflite', str(model_path), CLASS_INDICES_PATH, warmup=False)
+
+    registry.preload()
+
+    assert registry.model is None
+    assert registry.status()["preloaded"]
+    assert registry.get(timeout=5).model_content == b'flatbuffer'
+
+
+def test_missing_model_is_reported_instead_of_raised(tmp_path):
+    registry = ModelRegistry('tflite', str(tmp_path / 'missing.tflite'), CLASS_INDICES_PATH)
+    registry.preload()
+
+    with pytest.raises(RuntimeError, match='failed to load'):
+        registry.get(timeout=5)
+    assert not registry.is_ready()
+    assert registry.status()["state"] == 'failed'
+    assert registry.status()["error"]
+
+
+def test_readyz_reflects_model_state(stub_model, monkeypatch):
+    client = app.app.test_client()
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    assert response.get_json()["state"] == 'ready'
+
+    monkeypatch.setattr(app.model_registry, 'state', 'failed')
+    assert client.get('/readyz').status_code == 503
+    assert client.get('/healthz').status_code == 200
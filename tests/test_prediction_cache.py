@@ -0,0 +1,122 @@
+import sqlite3
+
+from app import PredictionCache, SQLiteCacheBackend
+
+
+def test_lru_evicts_least_recently_used():
+    cache = PredictionCache(max_entries=2, ttl=0, model_version='v1')
+    a, b, c = cache.key(b'a'), cache.key(b'b'), cache.key(b'c')
+    cache.put(a, {"class_name": "A"})
+    cache.put(b, {"class_name": "B"})
+    assert cache.get(a) == {"class_name": "A"}
+
+    cache.put(c, {"class_name": "C"})
+
+    assert cache.get(b) is None
+    assert cache.get(a) == {"class_name": "A"}
+    assert cache.get(c) == {"class_name": "C"}
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    assert (stats["hits"], stats["misses"]) == (3, 1)
+
+
+def test_ttl_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('app.time.monotonic', lambda: now[0])
+    cache = PredictionCache(max_entries=10, ttl=60, model_version='v1')
+    key = cache.key(b'leaf')
+    cache.put(key, {"class_name": "A"})
+
+    now[0] += 59
+    assert cache.get(key) == {"class_name": "A"}
+    now[0] += 2
+    assert cache.get(key) is None
+
+
+def test_key_depends_on_model_version_and_options():
+    v1 = PredictionCache(model_version='v1')
+    v2 = PredictionCache(model_version='v2')
+    assert v1.key(b'leaf') == v1.key(b'leaf')
+    assert v1.key(b'leaf') != v2.key(b'leaf')
+    assert v1.key(b'leaf') != v1.key(b'leaf', 3, 4)
+
+
+def test_returned_results_are_copies():
+    cache = PredictionCache(model_version='v1')
+    key = cache.key(b'leaf')
+    cache.put(key, {"class_name": "A"})
+    cache.get(key)["class_name"] = "changed"
+    assert cache.get(key) == {"class_name": "A"}
+
+
+def test_disabled_cache_stores_nothing():
+    cache = PredictionCache(max_entries=0, model_version='v1')
+    key = cache.key(b'leaf')
+    cache.put(key, {"class_name": "A"})
+    assert cache.get(key) is None
+
+
+def test_sqlite_backend_is_shared_between_caches(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first = PredictionCache(max_entries=4, ttl=60, model_version='v1',
+                            backend=SQLiteCacheBackend(path, 4, 60))
+    second = PredictionCache(max_entries=4, ttl=60, model_version='v1',
+                             backend=SQLiteCacheBackend(path, 4, 60))
+    key = first.key(b'leaf')
+    first.put(key, {"class_name": "A", "confidence": 0.5})
+
+    assert second.get(key) == {"class_name": "A", "confidence": 0.5}
+    assert second.stats()["hits"] == 1
+
+
+def test_sqlite_backend_connects_lazily(tmp_path):
+    path = tmp_path / 'cache.db'
+    backend = SQLiteCacheBackend(str(path), 4, 60)
+    assert not path.exists()
+
+    assert backend.get('missing') is None
+    assert path.exists()
+
+
+def test_sqlite_backend_prunes_least_recently_used_rows(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / 'cache.db'), 3, 0)
+    for i in range(5):
+        backend.put('k%d' % i, {"i": i})
+
+    assert backend.get('k0') is None
+    assert backend.get('k1') is None
+    assert [backend.get('k%d' % i)[0]["i"] for i in (2, 3, 4)] == [2, 3, 4]
+
+
+def test_sqlite_hits_only_touch_stale_rows(tmp_path, monkeypatch):
+    path = str(tmp_path / 'cache.db')
+    backend = SQLiteCacheBackend(path, 4, 0)
+    backend.put('k', {"i": 1})
+    conn = sqlite3.connect(path)
+    accessed = conn.execute('SELECT accessed FROM predictions').fetchone()[0]
+
+    backend.get('k')
+    assert conn.execute('SELECT accessed FROM predictions').fetchone()[0] == accessed
+
+    monkeypatch.setattr(SQLiteCacheBackend, 'TOUCH_INTERVAL', -1)
+    backend.get('k')
+    assert conn.execute('SELECT accessed FROM predictions').fetchone()[0] > accessed
+
+
+def test_backend_hits_keep_their_age_in_memory(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr('app.time.monotonic', lambda: clock[0])
+    monkeypatch.setattr('app.time.time', lambda: clock[0] + 1e9)
+    path = str(tmp_path / 'cache.db')
+    writer = PredictionCache(max_entries=4, ttl=60, model_version='v1',
+                             backend=SQLiteCacheBackend(path, 4, 60))
+    reader = PredictionCache(max_entries=4, ttl=60, model_version='v1',
+                             backend=SQLiteCacheBackend(path, 4, 60))
+    key = writer.key(b'leaf')
+    writer.put(key, {"class_name": "A"})
+
+    clock[0] += 50
+    assert reader.get(key) == {"class_name": "A"}
+    clock[0] += 11
+    assert reader.get(key) is None
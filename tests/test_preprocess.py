@@ -0,0 +1,73 @@
+import io
+import threading
+
+import numpy as np
+from PIL import Image
+
+from app import IMAGE_SIZE, preprocess_image_stream
+
+
+def _encode(img, format):
+    buf = io.BytesIO()
+    img.save(buf, format=format)
+    return buf.getvalue()
+
+
+def _gradient(width, height):
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)
+    pixels = np.stack(np.broadcast_arrays(x[np.newaxis, :], y[:, np.newaxis], 128), axis=-1)
+    return Image.fromarray(pixels.astype(np.uint8))
+
+
+def test_matches_nearest_resize_scaled_to_unit_range():
+    img = _gradient(300, 200)
+    data = _encode(img, 'PNG')
+
+    out = preprocess_image_stream(io.BytesIO(data))
+
+    expected = np.asarray(img.resize(IMAGE_SIZE, Image.NEAREST), dtype=np.float32) / 255.0
+    assert out.shape == IMAGE_SIZE + (3,)
+    assert out.dtype == np.float32
+    np.testing.assert_allclose(out, expected, atol=1e-6)
+
+
+def test_large_jpeg_is_decoded_at_reduced_scale():
+    img = _gradient(2000, 1500)
+    data = _encode(img, 'JPEG')
+
+    out = preprocess_image_stream(io.BytesIO(data))
+
+    full = np.asarray(Image.open(io.BytesIO(data)).resize(IMAGE_SIZE, Image.NEAREST), dtype=np.float32) / 255.0
+    assert out.shape == IMAGE_SIZE + (3,)
+    assert float(np.mean(np.abs(out - full))) < 0.02
+
+
+def test_converts_grayscale_and_rgba():
+    for mode in ('L', 'RGBA'):
+        data = _encode(Image.new(mode, (50, 40), 'white'), 'PNG')
+        out = preprocess_image_stream(io.BytesIO(data))
+        assert out.shape == IMAGE_SIZE + (3,)
+        assert float(out.min()) == 1.0
+
+
+def test_reuses_one_buffer_per_thread():
+    first = preprocess_image_stream(io.BytesIO(_encode(Image.new('RGB', (10, 10), 0), 'PNG')))
+    second = preprocess_image_stream(io.BytesIO(_encode(Image.new('RGB', (10, 10), 'white'), 'PNG')))
+    assert first is second
+    assert float(second.min()) == 1.0
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(
+        preprocess_image_stream(io.BytesIO(_encode(Image.new('RGB', (10, 10), 0), 'PNG')))))
+    thread.start()
+    thread.join()
+    assert other[0] is not first
+    assert float(first.min()) == 1.0
+
+
+def test_writes_into_given_buffer():
+    out = np.empty(IMAGE_SIZE + (3,), dtype=np.float32)
+    result = preprocess_image_stream(io.BytesIO(_encode(Image.new('RGB', (10, 10), 0), 'PNG')), out=out)
+    assert result is out
+    assert float(out.max()) == 0.0
@@ -0,0 +1,65 @@
+import io
+import json
+
+import pytest
+from PIL import Image
+
+import app
+from app import iter_jpeg_frames
+
+
+def _jpeg(payload):
+    return b'\xff\xd8' + payload + b'\xff\xd9'
+
+
+def test_splits_multipart_mjpeg():
+    frames = [_jpeg(b'a' * 5000), _jpeg(b'b'), _jpeg(b'c' * 300)]
+    body = b''.join(b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + f + b'\r\n' for f in frames) + b'--frame--'
+
+    assert list(iter_jpeg_frames(io.BytesIO(body), 1 << 20, chunk_size=7)) == frames
+
+
+def test_splits_concatenated_jpegs_and_ignores_trailing_partial_frame():
+    frames = [_jpeg(b'one'), _jpeg(b'two')]
+    body = b''.join(frames) + b'\xff\xd8incomplete'
+
+    assert list(iter_jpeg_frames(io.BytesIO(body), 1 << 20, chunk_size=3)) == frames
+
+
+def test_rejects_frames_over_the_limit():
+    body = b'\xff\xd8' + b'x' * 1000
+
+    with pytest.raises(ValueError):
+        list(iter_jpeg_frames(io.BytesIO(body), 100, chunk_size=64))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 16 * 1024])
+def test_markers_split_across_chunks(chunk_size):
+    frames = [_jpeg(b'\xff\x00' * 50), _jpeg(b'\xffx\xff'), _jpeg(b'')]
+    body = b'\xff' + b''.join(frames) + b'\xff'
+
+    assert list(iter_jpeg_frames(io.BytesIO(body), 1 << 20, chunk_size=chunk_size)) == frames
+
+
+def test_large_frame_in_small_chunks():
+    frame = _jpeg(bytes(range(0, 0xd8)) * 20000)
+
+    assert list(iter_jpeg_frames(io.BytesIO(frame * 2), 8 << 20, chunk_size=1024)) == [frame, frame]
+
+
+def test_esp32_route_streams_results_and_is_instrumented(stub_model, monkeypatch):
+    metrics = app.Metrics()
+    monkeypatch.setattr(app, 'metrics', metrics)
+    frames = []
+    for color in ('black', 'white'):
+        buf = io.BytesIO()
+        Image.new('RGB', (64, 48), color).save(buf, format='JPEG')
+        frames.append(buf.getvalue())
+    body = b''.join(b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + f + b'\r\n' for f in frames)
+
+    response = app.app.test_client().post('/analyze_esp32', data=body, content_type='multipart/x-mixed-replace')
+    rows = [json.loads(line) for line in response.get_data().splitlines()]
+    response.close()
+
+    assert rows and all("class_name" in row for row in rows)
+    assert metrics._values[('requests_total', (('endpoint', 'analyze_esp32'), ('status', 200)))] == 1
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+import app
+from app import TTA_TRANSFORMS, build_result, make_tta_views, prediction_options
+
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(0).random((32, 24, 3), dtype=np.float32)
+
+
+def test_views_are_identity_flips_then_crops(image):
+    views = make_tta_views(image, 4)
+
+    assert views.shape == (4,) + image.shape
+    np.testing.assert_array_equal(views[0], image)
+    np.testing.assert_array_equal(views[1], image[:, ::-1])
+    np.testing.assert_array_equal(views[2], image[::-1])
+    # Cắt giữa 7/8 ảnh (28x21) rồi phóng lại: góc trên trái là điểm (2, 1) của ảnh gốc
+    np.testing.assert_array_equal(views[3][0, 0], image[2, 1])
+    np.testing.assert_array_equal(views[3][-1, -1], image[29, 21])
+
+
+def test_corner_crops_keep_their_corner(image):
+    views = dict(zip(TTA_TRANSFORMS, make_tta_views(image, len(TTA_TRANSFORMS))))
+
+    np.testing.assert_array_equal(views['crop_tl'][0, 0], image[0, 0])
+    np.testing.assert_array_equal(views['crop_tr'][0, -1], image[0, -1])
+    np.testing.assert_array_equal(views['crop_bl'][-1, 0], image[-1, 0])
+    np.testing.assert_array_equal(views['crop_br'][-1, -1], image[-1, -1])
+
+
+def test_view_count_is_clamped(image):
+    assert len(make_tta_views(image, 0)) == 1
+    assert len(make_tta_views(image, 100)) == len(TTA_TRANSFORMS)
+
+
+@pytest.mark.parametrize('values, expected', [
+    ({}, (1, 1)),
+    ({'top_k': '3'}, (3, 1)),
+    ({'top_k': '99'}, (5, 1)),
+    ({'top_k': '0'}, (1, 1)),
+    ({'top_k': 'abc'}, (1, 1)),
+    ({'tta': 'on'}, (1, 4)),
+    ({'tta': 'off'}, (1, 1)),
+    ({'tta': '6'}, (1, 6)),
+    ({'tta': '50'}, (1, 8)),
+    ({'tta': '-2'}, (1, 1)),
+    ({'tta': 'maybe'}, (1, 1)),
+])
+def test_prediction_options_are_clamped(values, expected, monkeypatch):
+    monkeypatch.setitem(app.app.config, 'PREDICT_TOP_K', 1)
+    monkeypatch.setitem(app.app.config, 'PREDICT_TTA_VIEWS', 1)
+    monkeypatch.setitem(app.app.config, 'TOP_K_MAX', 5)
+    monkeypatch.setitem(app.app.config, 'TTA_DEFAULT_VIEWS', 4)
+    monkeypatch.setitem(app.app.config, 'TTA_MAX_VIEWS', 8)
+
+    assert prediction_options(values) == expected
+
+
+def test_build_result_top_k_is_sorted_by_confidence(stub_model):
+    prediction = np.zeros(stub_model.num_classes, dtype=np.float32)
+    prediction[[3, 7, 1]] = [0.2, 0.5, 0.3]
+
+    result = build_result(prediction, top_k=3)
+
+    class_indices = app.model_registry.class_indices
+    assert result["class_name"] == class_indices["7"]
+    assert result["confidence"] == pytest.approx(0.5)
+    assert [r["class_name"] for r in result["top_k"]] == [class_indices[i] for i in ("7", "1", "3")]
+    assert [r["confidence"] for r in result["top_k"]] == pytest.approx([0.5, 0.3, 0.2])
+    assert "top_k" not in build_result(prediction)
+
+
+def test_tta_runs_all_views_in_one_model_call(stub_model):
+    image = np.full((224, 224, 3), 0.5, dtype=np.float32)
+
+    result = app.predict_disease_tta(image, top_k=2, tta_views=4)
+
+    assert stub_model.batch_sizes == [4]
+    assert result["tta_views"] == 4
+    assert result["class_name"] == app.model_registry.class_indices[str(stub_model.class_for(image))]
+    assert len(result["top_k"]) == 2
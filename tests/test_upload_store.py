@@ -0,0 +1,95 @@
+import io
+import os
+import time
+
+from PIL import Image
+
+import app
+from app import UploadStore, content_digest
+
+
+def _touch(folder, name, size, age):
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_evict_removes_files_older_than_max_age(tmp_path):
+    store = UploadStore(str(tmp_path), max_bytes=0, max_age=3600)
+    _touch(str(tmp_path), 'old.jpg', 10, age=7200)
+    _touch(str(tmp_path), 'new.jpg', 10, age=10)
+
+    assert store.evict() == 1
+    assert sorted(os.listdir(tmp_path)) == ['new.jpg']
+
+
+def test_evict_removes_oldest_files_until_under_max_bytes(tmp_path):
+    store = UploadStore(str(tmp_path), max_bytes=250, max_age=0)
+    for i, age in enumerate([400, 300, 200, 100]):
+        _touch(str(tmp_path), 'f%d.jpg' % i, 100, age=age)
+
+    assert store.evict() == 2
+    assert sorted(os.listdir(tmp_path)) == ['f2.jpg', 'f3.jpg']
+
+
+def test_evict_keeps_gitkeep_and_recent_temp_files(tmp_path):
+    store = UploadStore(str(tmp_path), max_bytes=0, max_age=60)
+    _touch(str(tmp_path), '.gitkeep', 0, age=10 ** 6)
+    _touch(str(tmp_path), '.tmp-recent', 10, age=10)
+    _touch(str(tmp_path), '.tmp-stale', 10, age=7200)
+
+    store.evict()
+
+    assert sorted(os.listdir(tmp_path)) == ['.gitkeep', '.tmp-recent']
+
+
+def _jpeg():
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 48), 'green').save(buf, format='JPEG')
+    return buf.getvalue()
+
+
+def test_save_writes_a_thumbnail_named_by_content(tmp_path):
+    store = UploadStore(str(tmp_path), thumbnail_size=16, janitor_interval=3600)
+    data = _jpeg()
+
+    name = store.save(data)
+    store.wait(name)
+
+    assert name == content_digest(data) + '.jpg'
+    assert store.save(data, digest=content_digest(data)) == name
+    with Image.open(tmp_path / name) as img:
+        assert max(img.size) == 16
+
+
+def test_failed_writes_are_logged(tmp_path, caplog):
+    for write_async in (True, False):
+        store = UploadStore(str(tmp_path), janitor_interval=3600, write_async=write_async)
+        caplog.clear()
+
+        name = store.save(b'not an image')
+        store.wait(name)
+        store._executor.shutdown(wait=True)
+
+        assert 'Saving upload thumbnail %s failed' % name in caplog.text
+        assert not os.path.exists(tmp_path / name)
+
+
+def test_index_saves_the_upload_only_after_a_successful_prediction(stub_model, tmp_path, monkeypatch):
+    store = UploadStore(str(tmp_path), janitor_interval=3600, write_async=False)
+    monkeypatch.setattr(app, 'upload_store', store)
+    client = app.app.test_client()
+
+    response = client.post('/', data={'file': (io.BytesIO(b'not an image'), 'leaf.jpg')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 500
+    assert os.listdir(tmp_path) == []
+
+    data = _jpeg()
+    response = client.post('/', data={'file': (io.BytesIO(data), 'leaf.jpg')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert os.listdir(tmp_path) == [content_digest(data) + '.jpg']